@@ -4,6 +4,12 @@ from flask_login import LoginManager
 from flask_socketio import SocketIO
 import os
 from dotenv import load_dotenv
+from app.utils.cursors import CursorAggregator
+from app.utils.derivatives import DerivativePipeline
+from app.utils.imagegen import ImageGenerationService
+from app.utils.oplog import CanvasEventLog
+from app.utils.presence import PresenceRegistry
+from app.utils.chatwriter import ChatWriter
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,6 +17,12 @@ load_dotenv()
 db = SQLAlchemy()
 login_manager = LoginManager()
 socketio = SocketIO()
+cursor_aggregator = CursorAggregator()
+derivative_pipeline = DerivativePipeline()
+image_generator = ImageGenerationService()
+canvas_log = CanvasEventLog()
+presence = PresenceRegistry()
+chat_writer = ChatWriter()
 
 def create_app():
     app = Flask(__name__)
@@ -29,6 +41,16 @@ def create_app():
         
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
         print(f"✓ Using PostgreSQL database")
+        
+        # Pool per worker process. Under green threads a connection is only checked out
+        # for the length of one request or Socket.IO event, then returned on app context teardown
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': 1800,
+            'pool_pre_ping': True
+        }
     else:
         # Fallback to SQLite for development
         db_path = os.path.join(app.root_path, '..', 'instance', 'project_management.db')
@@ -37,7 +59,67 @@ def create_app():
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
+    # Largest file accepted through resumable chunked uploads
+    app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+    # Let a fronting nginx/Apache send upload bodies itself (X-Sendfile) instead of streaming them through Python
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    # Processes rendering image thumbnails and previews; 0 renders inline in the request
+    app.config['DERIVATIVE_WORKERS'] = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+    
+    # Realtime cursor fan-out: batched frames per second and max age of a buffered position
+    app.config['CURSOR_FLUSH_HZ'] = float(os.environ.get('CURSOR_FLUSH_HZ', 20))
+    app.config['CURSOR_STALE_SECONDS'] = float(os.environ.get('CURSOR_STALE_SECONDS', 1.0))
+    
+    # Canvas operation log: seconds realtime edits are buffered before being written as a revision,
+    # and revisions kept for reconnecting clients; every this many revisions the log is folded into the
+    # canvas content and rows older than the window are dropped
+    app.config['CANVAS_LOG_FLUSH_INTERVAL'] = float(os.environ.get('CANVAS_LOG_FLUSH_INTERVAL', 0.25))
+    app.config['CANVAS_LOG_RETENTION'] = int(os.environ.get('CANVAS_LOG_RETENTION', 500))
+    
+    # Seconds a resolved chat channel stays in the process cache; bounds how long other workers
+    # keep resolving a deleted project's channel
+    app.config['CHANNEL_CACHE_TTL'] = float(os.environ.get('CHANNEL_CACHE_TTL', 60))
+    
+    # Seconds a resolved project membership stays in the process cache
+    app.config['MEMBERSHIP_CACHE_TTL'] = float(os.environ.get('MEMBERSHIP_CACHE_TTL', 30))
+    
+    # Seconds dashboard counters are served from the process cache
+    app.config['DASHBOARD_STATS_TTL'] = float(os.environ.get('DASHBOARD_STATS_TTL', 30))
+    
+    # Seconds the logged-in user snapshot is reused before reloading it from the database
+    app.config['SESSION_PRINCIPAL_TTL'] = float(os.environ.get('SESSION_PRINCIPAL_TTL', 60))
+    
+    # Cross-worker Socket.IO fan-out: unset keeps rooms in process memory (single worker),
+    # "postgresql" uses LISTEN/NOTIFY on DATABASE_URL, redis:// or amqp:// URLs use that broker
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    app.config['SOCKETIO_CHANNEL'] = os.environ.get('SOCKETIO_CHANNEL', 'projectflow_socketio')
+    
+    # Chat write-behind: messages waiting before senders get 503, seconds between group commits,
+    # and messages written per commit
+    app.config['CHAT_QUEUE_SIZE'] = int(os.environ.get('CHAT_QUEUE_SIZE', 10000))
+    app.config['CHAT_FLUSH_INTERVAL'] = float(os.environ.get('CHAT_FLUSH_INTERVAL', 0.05))
+    app.config['CHAT_BATCH_SIZE'] = int(os.environ.get('CHAT_BATCH_SIZE', 500))
+    
+    # Canvas room presence: 'memory' for a single worker, 'database' shares it between workers through
+    # the canvas_presence table (the default whenever broadcasts go through a message queue).
+    # Connections silent for PRESENCE_TIMEOUT seconds are swept every PRESENCE_SWEEP_INTERVAL.
+    app.config['PRESENCE_BACKEND'] = os.environ.get(
+        'PRESENCE_BACKEND', 'database' if app.config['SOCKETIO_MESSAGE_QUEUE'] else 'memory')
+    app.config['PRESENCE_TIMEOUT'] = float(os.environ.get('PRESENCE_TIMEOUT', 75))
+    app.config['PRESENCE_SWEEP_INTERVAL'] = float(os.environ.get('PRESENCE_SWEEP_INTERVAL', 15))
+    
+    # Socket.IO concurrency model; serve.py switches this to green threads for production
+    app.config['SOCKETIO_ASYNC_MODE'] = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+    
+    # Image generation: provider ('pollinations' or the offline 'fake'), concurrent provider calls,
+    # distinct prompts allowed in flight, seconds a generated image is reused for the same prompt,
+    # and seconds a job's status is kept for polling
+    app.config['IMAGE_PROVIDER'] = os.environ.get('IMAGE_PROVIDER', 'pollinations')
+    app.config['IMAGE_GENERATION_WORKERS'] = int(os.environ.get('IMAGE_GENERATION_WORKERS', 4))
+    app.config['IMAGE_GENERATION_MAX_PENDING'] = int(os.environ.get('IMAGE_GENERATION_MAX_PENDING', 32))
+    app.config['IMAGE_CACHE_TTL'] = float(os.environ.get('IMAGE_CACHE_TTL', 3600))
+    app.config['IMAGE_JOB_TTL'] = float(os.environ.get('IMAGE_JOB_TTL', 3600))
     
     # Ensure upload directories exist
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'canvas'), exist_ok=True)
@@ -46,7 +128,37 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio_options = {'cors_allowed_origins': '*', 'async_mode': app.config['SOCKETIO_ASYNC_MODE']}
+    message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+    if message_queue:
+        from app.utils.pubsub import create_client_manager
+        client_manager = create_client_manager(message_queue, app.config['SQLALCHEMY_DATABASE_URI'],
+                                               app.config['SOCKETIO_CHANNEL'])
+        if client_manager:
+            socketio_options['client_manager'] = client_manager
+        else:
+            socketio_options['message_queue'] = message_queue
+            socketio_options['channel'] = app.config['SOCKETIO_CHANNEL']
+        print(f"✓ Socket.IO broadcasts shared through {message_queue.split('://')[0]}")
+    socketio.init_app(app, **socketio_options)
+    cursor_aggregator.init_app(app, socketio)
+    derivative_pipeline.init_app(app, socketio)
+    image_generator.init_app(app, socketio)
+    canvas_log.init_app(app, socketio)
+    presence.init_app(app, socketio)
+    chat_writer.init_app(app, socketio)
+    
+    from app.utils.access import membership_cache
+    membership_cache.ttl = app.config['MEMBERSHIP_CACHE_TTL']
+    
+    from app.utils.channels import channel_cache
+    channel_cache.ttl = app.config['CHANNEL_CACHE_TTL']
+    
+    from app.utils.stats import stats_cache
+    stats_cache.ttl = app.config['DASHBOARD_STATS_TTL']
+    
+    from app.utils.principal import principal_cache
+    principal_cache.ttl = app.config['SESSION_PRINCIPAL_TTL']
     
     # Login manager configuration
     login_manager.login_view = 'auth.login'
@@ -55,8 +167,8 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models.user import User
-        return User.query.get(int(user_id))
+        from app.utils.principal import load_principal
+        return load_principal(int(user_id))
     
     # Register template filter
     @app.template_filter('datetime')
@@ -73,6 +185,7 @@ def create_app():
     from app.modules.admin.routes import admin_bp
     from app.modules.invitations.routes import invitations_bp
     from app.modules.canvas.routes import canvas_bp
+    from app.modules.uploads.routes import uploads_bp
     
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
@@ -81,6 +194,14 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(invitations_bp, url_prefix='/invitations')
     app.register_blueprint(canvas_bp, url_prefix='/canvas')
+    app.register_blueprint(uploads_bp)
+    
+    # Register Socket.IO event handlers
+    from app import socketio_events
+    
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
     
     # Root route
     @app.route('/')
@@ -109,6 +230,20 @@ def create_app():
             db.create_all()
             print("✓ Database tables created successfully")
             
+            # Columns added to tables that already existed
+            from app.utils.schema import upgrade_schema
+            changes = upgrade_schema(db.engine)
+            for change in changes:
+                print(f"✓ Schema upgrade: {change}")
+            if 'added projects.task_count' in changes:
+                from app.models.project import Project
+                Project.rebuild_task_counters()
+                db.session.commit()
+            
+            # Full-text index tables live outside the models (dialect-specific DDL)
+            from app.utils.search import init_search
+            init_search()
+            
             # Create default admin user if it doesn't exist
             from app.models.user import User
             admin_user = User.query.filter_by(email='admin@example.com').first()
@@ -0,0 +1,103 @@
+import click
+import os
+import time
+from app import db, derivative_pipeline
+from app.models.user import User
+from app.models.project import Project
+from app.models.canvas import Canvas, CanvasElement, CanvasBlob
+from app.utils.uploads import upload_tmp_folder
+from app.utils.derivatives import is_image, render_derivatives
+from app.utils.search import rebuild_search_index
+from app.utils.oplog import compact_canvas_log
+
+def register_commands(app):
+    @app.cli.command('rebuild-project-stats')
+    @click.option('--project-id', type=int, default=None, help='Only rebuild this project.')
+    def rebuild_project_stats(project_id):
+        """Recount task_count, completed_count and progress from the tasks table."""
+        updated = Project.rebuild_task_counters(project_id)
+        db.session.commit()
+        print(f"✓ Rebuilt task counters for {updated} project(s)")
+
+    @app.cli.command('pack-canvas-elements')
+    @click.option('--batch-size', type=int, default=500, help='Elements converted per commit.')
+    def pack_canvas_elements(batch_size):
+        """Move legacy JSON element content and style into the packed columns."""
+        converted = 0
+        last_id = 0
+        while True:
+            elements = CanvasElement.query.filter(
+                CanvasElement.id > last_id,
+                db.or_(CanvasElement.content_data.is_(None), CanvasElement.style_data.is_(None))
+            ).order_by(CanvasElement.id).limit(batch_size).all()
+            if not elements:
+                break
+            
+            for element in elements:
+                if element.content_data is None:
+                    element.set_content_json(element.get_content_json())
+                if element.style_data is None:
+                    element.set_style_json(element.get_style_json())
+            db.session.commit()
+            
+            converted += len(elements)
+            last_id = elements[-1].id
+        print(f"✓ Packed {converted} canvas element(s)")
+    
+    @app.cli.command('purge-uploads')
+    @click.option('--hours', type=float, default=24, help='Remove unfinished uploads older than this.')
+    def purge_uploads(hours):
+        """Delete abandoned resumable upload sessions and their partial files."""
+        cutoff = time.time() - hours * 3600
+        folder = upload_tmp_folder()
+        removed = 0
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        print(f"✓ Removed {removed} stale upload file(s)")
+    
+    @app.cli.command('compact-canvas-log')
+    @click.option('--retention', type=int, default=None, help='Revisions to keep per canvas (default CANVAS_LOG_RETENTION).')
+    def compact_canvas_log_command(retention):
+        """Fold old canvas operations into the canvas snapshot."""
+        if retention is None:
+            retention = app.config['CANVAS_LOG_RETENTION']
+        removed = 0
+        for canvas in Canvas.query.all():
+            removed += compact_canvas_log(canvas, retention)
+            db.session.commit()
+        print(f"✓ Compacted {removed} canvas operation(s)")
+    
+    @app.cli.command('build-derivatives')
+    def build_derivatives():
+        """Render missing thumbnails and previews for stored images and avatars."""
+        upload_folder = app.config['UPLOAD_FOLDER']
+        rendered = 0
+        
+        for blob in CanvasBlob.query.filter(CanvasBlob.derivatives.is_(None)).all():
+            if is_image(blob.storage_path):
+                variants = derivative_pipeline.to_variants(
+                    render_derivatives(os.path.join(upload_folder, blob.storage_path)))
+                blob.set_derivatives_json(variants)
+                db.session.commit()
+                rendered += 1
+        
+        users = User.query.filter(User.profile_picture_variants.is_(None),
+                                  User.profile_picture != 'default-avatar.png').all()
+        for user in users:
+            source_path = os.path.join(upload_folder, 'avatars', user.profile_picture)
+            if user.profile_picture and os.path.exists(source_path):
+                user.set_profile_picture_variants(derivative_pipeline.to_variants(render_derivatives(source_path)))
+                db.session.commit()
+                rendered += 1
+        print(f"✓ Rendered derivatives for {rendered} image(s)")
+    
+    @app.cli.command('rebuild-search-index')
+    @click.option('--batch-size', type=int, default=1000, help='Rows indexed per statement.')
+    def rebuild_search_index_command(batch_size):
+        """Re-index projects, tasks, users and chat messages from scratch."""
+        with db.engine.begin() as connection:
+            counts = rebuild_search_index(connection, batch_size)
+        print("✓ Search index rebuilt: " + ', '.join(f'{count} {entity}(s)' for entity, count in counts.items()))
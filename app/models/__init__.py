@@ -1,7 +1,7 @@
 from .user import User
 from .project import Project
 from .task import Task
-from .canvas import Canvas, CanvasElement, CanvasChatMessage, CanvasFile
+from .canvas import Canvas, CanvasElement, CanvasChatMessage, CanvasFile, CanvasBlob, CanvasOperation, CanvasPresence, ImageGenerationJob
 from .invitation import ProjectInvitation, ProjectMember
 
-__all__ = ['User', 'Project', 'Task', 'Canvas', 'CanvasElement', 'CanvasChatMessage', 'CanvasFile', 'ProjectInvitation', 'ProjectMember']
+__all__ = ['User', 'Project', 'Task', 'Canvas', 'CanvasElement', 'CanvasChatMessage', 'CanvasFile', 'CanvasBlob', 'CanvasOperation', 'CanvasPresence', 'ImageGenerationJob', 'ProjectInvitation', 'ProjectMember']
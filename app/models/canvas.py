@@ -1,47 +1,294 @@
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from app import db
 import json
+import msgpack
+
+# Element-level operations accepted by Canvas.apply_operations
+CANVAS_OPERATIONS = ('add', 'move', 'resize', 'restyle', 'update', 'delete')
+
+# Style keys read on every render, stored in their own columns: key -> (column, accepted types)
+PROMOTED_STYLE_FIELDS = {
+    'backgroundColor': ('background_color', (str,)),
+    'color': ('color', (str,)),
+    'fontFamily': ('font_family', (str,)),
+    'fontSize': ('font_size', (int, float)),
+    'opacity': ('opacity', (int, float))
+}
+PROMOTED_STRING_LENGTH = 100
+
+def pack_payload(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+def unpack_payload(data):
+    # Decoded on every access: each caller gets its own dict, and msgpack is cheap enough not to cache
+    return msgpack.unpackb(bytes(data), raw=False)
+
+def apply_operation(elements, positions, operation):
+    # Applies one element operation in place; deleted elements are left as None until the caller compacts
+    if not isinstance(operation, dict):
+        raise ValueError('Each operation must be an object')
+    
+    op = operation.get('op')
+    if op == 'add':
+        element = operation.get('element')
+        if not isinstance(element, dict) or element.get('id') is None:
+            raise ValueError('add operation requires an element with an id')
+        element = dict(element)  # later operations edit the stored element, not the logged one
+        if element['id'] in positions:
+            elements[positions[element['id']]] = element
+        else:
+            positions[element['id']] = len(elements)
+            elements.append(element)
+        return
+    
+    if op not in CANVAS_OPERATIONS:
+        raise ValueError(f'Unknown operation: {op}')
+    
+    element_id = operation.get('id')
+    if element_id not in positions:
+        raise ValueError(f'Element {element_id} does not exist')
+    
+    if op == 'delete':
+        elements[positions.pop(element_id)] = None
+        return
+    
+    element = elements[positions[element_id]]
+    if op == 'move':
+        element['x'] = operation.get('x', element.get('x'))
+        element['y'] = operation.get('y', element.get('y'))
+    elif op == 'resize':
+        element['width'] = operation.get('width', element.get('width'))
+        element['height'] = operation.get('height', element.get('height'))
+    elif op == 'restyle':
+        element['style'] = {**(element.get('style') or {}), **(operation.get('style') or {})}
+    else:
+        element.update(operation.get('fields') or {})
+
+def validate_operations(operations):
+    # Checks each operation's shape without the canvas; operations on elements that no longer exist
+    # are skipped when the log is folded
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError('Each operation must be an object')
+        op = operation.get('op')
+        if op not in CANVAS_OPERATIONS:
+            raise ValueError(f'Unknown operation: {op}')
+        if op == 'add':
+            element = operation.get('element')
+            if not isinstance(element, dict) or element.get('id') is None:
+                raise ValueError('add operation requires an element with an id')
+        elif operation.get('id') is None:
+            raise ValueError(f'{op} operation requires an element id')
+        elif op == 'restyle' and not isinstance(operation.get('style') or {}, dict):
+            raise ValueError('restyle operation requires a style object')
+        elif op == 'update' and not isinstance(operation.get('fields') or {}, dict):
+            raise ValueError('update operation requires a fields object')
+
+def fold_operations(content, operations, strict=True):
+    # Applies operations to a content dict in place. Raises ValueError on a malformed operation, after
+    # which content is partly applied and should be discarded; with strict=False such operations are skipped.
+    elements = content.get('elements', [])
+    positions = {element.get('id'): index for index, element in enumerate(elements)}
+    
+    applied = []
+    for operation in operations:
+        if isinstance(operation, dict) and operation.get('op') == 'snapshot':
+            # Logged by a full save that can't be expressed element by element: replaces the whole canvas
+            content.clear()
+            content.update(json.loads(json.dumps(operation.get('content') or {})))
+            elements = content.setdefault('elements', [])
+            positions = {element.get('id'): index for index, element in enumerate(elements)}
+            applied.append(operation)
+            continue
+        try:
+            apply_operation(elements, positions, operation)
+        except ValueError:
+            if strict:
+                raise
+            continue
+        applied.append(operation)
+    
+    content['elements'] = [element for element in elements if element is not None]
+    return applied
+
+def diff_content(old, new):
+    # The operations that turn content `old` into `new`, so a full save can be replayed from the log.
+    # Changed elements are re-added in place; when the element order, the canvas settings or an element
+    # without an id changed, the save is logged as one snapshot operation instead.
+    snapshot = [{'op': 'snapshot', 'content': new}]
+    old_list, new_list = old.get('elements', []), new.get('elements', [])
+    if not all(isinstance(element, dict) and element.get('id') is not None for element in old_list + new_list):
+        return snapshot
+    
+    old_elements = {element['id']: element for element in old_list}
+    new_ids = [element['id'] for element in new_list]
+    kept = set(new_ids)
+    if len(old_elements) != len(old_list) or len(kept) != len(new_ids):
+        return snapshot
+    
+    replayed = [element_id for element_id in old_elements if element_id in kept]
+    replayed += [element_id for element_id in new_ids if element_id not in old_elements]
+    settings_changed = ({key: value for key, value in old.items() if key != 'elements'} !=
+                        {key: value for key, value in new.items() if key != 'elements'})
+    if replayed != new_ids or settings_changed:
+        return snapshot
+    
+    operations = [{'op': 'delete', 'id': element_id} for element_id in old_elements if element_id not in kept]
+    operations += [{'op': 'add', 'element': element} for element in new_list
+                   if old_elements.get(element['id']) != element]
+    return operations
+
+def content_in_viewport(content, x1, y1, x2, y2, min_size=None, offset=0, limit=500):
+    # Elements of a content dict (the board the canvas page edits) intersecting the box, in board order,
+    # from position `offset`. Returns (elements, next offset or None). Content is one JSON document, so
+    # this is a linear scan; elements without numeric x/y/width/height are always included.
+    matched, elements = [], content.get('elements', [])
+    for index in range(max(offset, 0), len(elements)):
+        element = elements[index]
+        try:
+            x, y = float(element.get('x', 0)), float(element.get('y', 0))
+            width, height = float(element.get('width', 0)), float(element.get('height', 0))
+        except (AttributeError, TypeError, ValueError):
+            x = y = width = height = None
+        if x is not None:
+            if x > x2 or y > y2 or x + width < x1 or y + height < y1:
+                continue
+            if min_size is not None and width < min_size and height < min_size:
+                continue
+        if len(matched) == limit:
+            return matched, index
+        matched.append(element)
+    return matched, None
 
 class Canvas(db.Model):
     __tablename__ = 'canvas'
     
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))  # NULL for the global and admin chat channels
+    # 'project:<id>', 'global' or 'admin'; resolved through app.utils.channels
+    channel_key = db.Column(db.String(64), unique=True)
     title = db.Column(db.String(200), nullable=False, default='Untitled Canvas')
     content = db.Column(db.Text)  # JSON content of canvas elements
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_saved = db.Column(db.DateTime, default=datetime.utcnow)
+    revision = db.Column(db.Integer, nullable=False, default=0)  # bumped on every save or patch
+    # content holds the canvas as of this revision; logged operations after it are folded in by compaction
+    # or written by the next full save
+    snapshot_revision = db.Column(db.Integer, nullable=False, default=0)
+    # Largest element width/height ever stored; they only grow, so they safely bound viewport scans.
+    # NULL on rows that predate the columns until get_element_bounds measures them.
+    max_element_width = db.Column(db.Float, default=0)
+    max_element_height = db.Column(db.Float, default=0)
     
     # Relationships
     project = db.relationship('Project', backref='canvas_items')
     creator = db.relationship('User', backref='created_canvas')
     elements = db.relationship('CanvasElement', backref='canvas', cascade='all, delete-orphan')
     chat_messages = db.relationship('CanvasChatMessage', backref='canvas', cascade='all, delete-orphan')
+    operations = db.relationship('CanvasOperation', backref='canvas', lazy='dynamic', cascade='all, delete-orphan')
     
     def get_content_json(self):
         if self.content:
             return json.loads(self.content)
         return {'elements': [], 'settings': {'theme': 'light'}}
     
+    def extend_element_bounds(self, width, height):
+        # Grown in SQL so concurrent element writes can't lower each other's bound; unknown stays unknown
+        self.max_element_width = db.case(
+            (Canvas.max_element_width.is_(None), None),
+            (Canvas.max_element_width >= width, Canvas.max_element_width),
+            else_=width
+        )
+        self.max_element_height = db.case(
+            (Canvas.max_element_height.is_(None), None),
+            (Canvas.max_element_height >= height, Canvas.max_element_height),
+            else_=height
+        )
+    
+    def get_element_bounds(self):
+        if self.max_element_width is None or self.max_element_height is None:
+            width, height = db.session.query(
+                db.func.max(CanvasElement.width), db.func.max(CanvasElement.height)
+            ).filter(CanvasElement.canvas_id == self.id).one()
+            self.max_element_width = width or 0
+            self.max_element_height = height or 0
+        return self.max_element_width, self.max_element_height
+    
     def set_content_json(self, content_dict):
         self.content = json.dumps(content_dict)
     
+    def apply_operations(self, operations, strict=True):
+        # Folds operations into the stored content, which is only written once they all applied
+        content = self.get_content_json()
+        applied = fold_operations(content, operations, strict)
+        self.set_content_json(content)
+        return applied
+    
+    def pending_operations(self):
+        # Logged operations after snapshot_revision, which content doesn't include yet
+        rows = self.operations.filter(CanvasOperation.revision > (self.snapshot_revision or 0),
+                                      CanvasOperation.operations.isnot(None))\
+                              .order_by(CanvasOperation.revision.asc()).all()
+        return [operation for row in rows for operation in row.get_operations_json()]
+    
+    def get_current_content_json(self):
+        # The canvas at its latest revision: the stored snapshot with the pending operations replayed
+        content = self.get_content_json()
+        fold_operations(content, self.pending_operations(), strict=False)
+        return content
+    
     def to_dict(self):
         return {
             'id': self.id,
             'project_id': self.project_id,
             'title': self.title,
-            'content': self.get_content_json(),
+            'content': self.get_current_content_json(),
+            'revision': self.revision,
+            'snapshot_revision': self.snapshot_revision,
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'last_saved': self.last_saved.isoformat()
         }
 
+class CanvasOperation(db.Model):
+    __tablename__ = 'canvas_operations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    canvas_id = db.Column(db.Integer, db.ForeignKey('canvas.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    operations = db.Column(db.Text)  # JSON list of element operations; NULL for full saves logged before they were diffed
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Unique constraint - also guards against two writers claiming the same revision
+    __table_args__ = (db.UniqueConstraint('canvas_id', 'revision', name='unique_canvas_revision'),)
+    
+    def get_operations_json(self):
+        if self.operations:
+            return json.loads(self.operations)
+        return None
+    
+    def set_operations_json(self, operations):
+        self.operations = json.dumps(operations)
+    
+    def is_full_save(self):
+        return self.operations is None
+    
+    def to_dict(self):
+        return {
+            'revision': self.revision,
+            'operations': self.get_operations_json(),
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat()
+        }
+
 class CanvasElement(db.Model):
     __tablename__ = 'canvas_elements'
+    __table_args__ = (db.Index('idx_canvas_elements_canvas_id_position', 'canvas_id', 'position_x', 'position_y'),)
     
     id = db.Column(db.Integer, primary_key=True)
     canvas_id = db.Column(db.Integer, db.ForeignKey('canvas.id'), nullable=False)
@@ -50,28 +297,90 @@ class CanvasElement(db.Model):
     position_y = db.Column(db.Float, default=0)
     width = db.Column(db.Float, default=200)
     height = db.Column(db.Float, default=100)
-    content = db.Column(db.Text)  # JSON content specific to element type
-    style = db.Column(db.Text)  # JSON style properties
+    content = db.Column(db.Text)  # legacy JSON content, read only while content_data is NULL
+    style = db.Column(db.Text)  # legacy JSON style, read only while style_data is NULL
+    content_data = db.Column(db.LargeBinary)  # msgpack content specific to element type
+    style_data = db.Column(db.LargeBinary)  # msgpack style properties that have no column
+    background_color = db.Column(db.String(PROMOTED_STRING_LENGTH))
+    color = db.Column(db.String(PROMOTED_STRING_LENGTH))
+    font_family = db.Column(db.String(PROMOTED_STRING_LENGTH))
+    font_size = db.Column(db.Float)
+    opacity = db.Column(db.Float)
     z_index = db.Column(db.Integer, default=1)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def get_content_json(self):
+        if self.content_data is not None:
+            return unpack_payload(self.content_data)
         if self.content:
             return json.loads(self.content)
         return {}
     
     def set_content_json(self, content_dict):
-        self.content = json.dumps(content_dict)
+        for column, value in self.pack_content(content_dict).items():
+            setattr(self, column, value)
+    
+    @classmethod
+    def in_viewport(cls, canvas, x1, y1, x2, y2, min_size=None, after_id=None, limit=500):
+        # Returns (elements intersecting the box in id order, has_more). The position range,
+        # widened by the canvas' largest element, lets the (canvas_id, position_x, position_y) index do the scan.
+        max_width, max_height = canvas.get_element_bounds()
+        query = cls.query.filter(
+            cls.canvas_id == canvas.id,
+            cls.position_x.between(x1 - max_width, x2),
+            cls.position_y.between(y1 - max_height, y2),
+            cls.position_x + cls.width >= x1,
+            cls.position_y + cls.height >= y1
+        )
+        
+        if min_size is not None:
+            query = query.filter(db.or_(cls.width >= min_size, cls.height >= min_size))
+        if after_id is not None:
+            query = query.filter(cls.id > after_id)
+        
+        elements = query.order_by(cls.id.asc()).limit(limit + 1).all()
+        return elements[:limit], len(elements) > limit
+    
+    @staticmethod
+    def pack_content(content_dict):
+        # Column values for a content dict, shared by set_content_json and bulk writes
+        return {'content_data': pack_payload(content_dict), 'content': None}
     
     def get_style_json(self):
-        if self.style:
-            return json.loads(self.style)
-        return {}
+        if self.style_data is None:
+            return json.loads(self.style) if self.style else {}
+        
+        style = unpack_payload(self.style_data)
+        promoted = {}
+        for key, (column, _) in PROMOTED_STYLE_FIELDS.items():
+            value = getattr(self, column)
+            if value is not None:
+                # Float columns hand back 16.0 for a stored 16
+                promoted[key] = int(value) if isinstance(value, float) and value.is_integer() else value
+        return {**style, **promoted} if promoted else style
     
     def set_style_json(self, style_dict):
-        self.style = json.dumps(style_dict)
+        for column, value in self.pack_style(style_dict).items():
+            setattr(self, column, value)
+    
+    @staticmethod
+    def pack_style(style_dict):
+        # Column values for a style dict, shared by set_style_json and bulk writes
+        style = dict(style_dict or {})
+        values = {}
+        for key, (column, types) in PROMOTED_STYLE_FIELDS.items():
+            value = style.get(key)
+            # Values of any other shape (e.g. fontSize "16px" or a long gradient) stay in the packed blob
+            fits = not isinstance(value, str) or len(value) <= PROMOTED_STRING_LENGTH
+            if isinstance(value, types) and not isinstance(value, bool) and fits:
+                values[column] = style.pop(key)
+            else:
+                values[column] = None
+        values['style_data'] = pack_payload(style)
+        values['style'] = None
+        return values
     
     def to_dict(self):
         return {
@@ -99,11 +408,32 @@ class CanvasChatMessage(db.Model):
     message = db.Column(db.Text, nullable=False)
     message_type = db.Column(db.String(20), default='text')  # text, file, image
     file_path = db.Column(db.String(500))  # for file attachments
+    client_ref = db.Column(db.String(32))  # handed to the sender when the message was queued
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref='canvas_messages')
     
+    # Keyset pagination walks (canvas_id, id); senders look their queued messages up by client_ref
+    __table_args__ = (
+        db.Index('idx_canvas_chat_messages_canvas_id_id', 'canvas_id', 'id'),
+        db.Index('idx_canvas_chat_messages_client_ref', 'client_ref')
+    )
+    
+    @classmethod
+    def history(cls, canvas_id, before_id=None, after_id=None, limit=50):
+        # Returns (messages oldest first, has_more); after_id fetches newer messages, otherwise pages backwards
+        query = cls.query.options(joinedload(cls.user)).filter(cls.canvas_id == canvas_id)
+        
+        if after_id is not None:
+            messages = query.filter(cls.id > after_id).order_by(cls.id.asc()).limit(limit + 1).all()
+            return messages[:limit], len(messages) > limit
+        
+        if before_id is not None:
+            query = query.filter(cls.id < before_id)
+        messages = query.order_by(cls.id.desc()).limit(limit + 1).all()
+        return list(reversed(messages[:limit])), len(messages) > limit
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -113,6 +443,38 @@ class CanvasChatMessage(db.Model):
             'message': self.message,
             'message_type': self.message_type,
             'file_path': self.file_path,
+            'client_ref': self.client_ref,
+            'created_at': self.created_at.isoformat()
+        }
+
+class CanvasBlob(db.Model):
+    __tablename__ = 'canvas_blobs'
+    
+    # One stored copy per distinct file content, shared by every CanvasFile that uploads it
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    storage_path = db.Column(db.String(500), nullable=False)  # relative to UPLOAD_FOLDER
+    derivatives = db.Column(db.Text)  # JSON list of resized renditions; NULL until rendered
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    files = db.relationship('CanvasFile', backref='blob', lazy='dynamic')
+    
+    def get_derivatives_json(self):
+        if self.derivatives:
+            return json.loads(self.derivatives)
+        return []
+    
+    def set_derivatives_json(self, derivatives):
+        self.derivatives = json.dumps(derivatives)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sha256': self.sha256,
+            'size': self.size,
+            'url': f'/static/uploads/{self.storage_path}',
+            'derivatives': self.get_derivatives_json(),
             'created_at': self.created_at.isoformat()
         }
 
@@ -121,11 +483,12 @@ class CanvasFile(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     canvas_id = db.Column(db.Integer, db.ForeignKey('canvas.id'), nullable=False)
+    blob_id = db.Column(db.Integer, db.ForeignKey('canvas_blobs.id'))  # NULL for files stored before dedup
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50), nullable=False)
-    file_size = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -141,7 +504,66 @@ class CanvasFile(db.Model):
             'file_path': self.file_path,
             'file_type': self.file_type,
             'file_size': self.file_size,
+            'sha256': self.blob.sha256 if self.blob else None,
+            'derivatives': self.blob.get_derivatives_json() if self.blob else [],
             'uploaded_by': self.uploaded_by,
             'uploader_name': self.uploader.get_full_name(),
             'uploaded_at': self.uploaded_at.isoformat()
         }
+
+class CanvasPresence(db.Model):
+    __tablename__ = 'canvas_presence'
+    
+    # One row per socket connection in a canvas room. No foreign keys: rows are ephemeral,
+    # dropped on leave/disconnect and swept once last_seen falls behind the heartbeat timeout.
+    sid = db.Column(db.String(64), primary_key=True)
+    canvas_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    user_name = db.Column(db.String(200))
+    protocol = db.Column(db.String(10), nullable=False, default='json')  # realtime encoding, see app.utils.protocol
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_canvas_presence_canvas_id_user_id', 'canvas_id', 'user_id'),
+        db.Index('idx_canvas_presence_last_seen', 'last_seen')
+    )
+
+class ImageGenerationJob(db.Model):
+    __tablename__ = 'image_generation_jobs'
+    
+    # Shared by every worker, so a job can be polled through any of them. No foreign keys, like
+    # presence: rows are ephemeral and dropped once they are older than IMAGE_JOB_TTL.
+    job_id = db.Column(db.String(32), primary_key=True)
+    canvas_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed
+    prompt = db.Column(db.Text, nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    model = db.Column(db.String(50), nullable=False)
+    generated_by = db.Column(db.String(200))
+    cached = db.Column(db.Boolean, nullable=False, default=False)
+    image_url = db.Column(db.Text)
+    message = db.Column(db.Text)  # why the job failed
+    generated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (db.Index('idx_image_generation_jobs_created_at', 'created_at'),)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'canvas_id': self.canvas_id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'prompt': self.prompt,
+            'width': self.width,
+            'height': self.height,
+            'model': self.model,
+            'generated_by': self.generated_by,
+            'cached': self.cached,
+            'image_url': self.image_url,
+            'message': self.message,
+            'generated_at': self.generated_at.isoformat() if self.generated_at else None
+        }
@@ -1,6 +1,10 @@
 from datetime import datetime
 from app import db
 
+def progress_expression(total, completed):
+    # Integer percentage rounded half up, evaluated by the database
+    return db.case((total > 0, (completed * 200 + total) // (total * 2)), else_=0)
+
 class Project(db.Model):
     __tablename__ = 'projects'
     
@@ -15,6 +19,8 @@ class Project(db.Model):
     deadline = db.Column(db.DateTime)
     budget = db.Column(db.Float)
     progress = db.Column(db.Integer, default=0)  # 0-100%
+    task_count = db.Column(db.Integer, nullable=False, default=0)  # maintained on task writes
+    completed_count = db.Column(db.Integer, nullable=False, default=0)  # maintained on task writes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -22,16 +28,46 @@ class Project(db.Model):
     tasks = db.relationship('Task', backref='project', lazy=True, cascade='all, delete-orphan')
     
     def get_task_count(self):
-        return len(self.tasks)
+        return self.task_count or 0
     
     def get_completed_tasks(self):
-        return len([task for task in self.tasks if task.status == 'completed'])
+        return self.completed_count or 0
     
     def calculate_progress(self):
-        if not self.tasks:
+        if not self.task_count:
             return 0
-        completed = self.get_completed_tasks()
-        return round((completed / len(self.tasks)) * 100)
+        # Same integer half-up rule as progress_expression, so stored and computed progress agree
+        return (self.completed_count * 200 + self.task_count) // (self.task_count * 2)
+    
+    def apply_task_delta(self, total_delta=0, completed_delta=0):
+        # Incremented in SQL so concurrent task writes don't overwrite each other's counts
+        total = Project.task_count + total_delta
+        completed = Project.completed_count + completed_delta
+        self.task_count = total
+        self.completed_count = completed
+        self.progress = progress_expression(total, completed)
+    
+    def record_task_status_change(self, old_status, new_status):
+        if old_status != new_status:
+            self.apply_task_delta(completed_delta=(new_status == 'completed') - (old_status == 'completed'))
+    
+    @classmethod
+    def rebuild_task_counters(cls, project_id=None):
+        # Recount from the tasks table to repair drift; returns the number of projects updated
+        from app.models.task import Task
+        total = db.select(db.func.count(Task.id)).where(Task.project_id == cls.id).scalar_subquery()
+        completed = db.select(db.func.count(Task.id)).where(
+            Task.project_id == cls.id, Task.status == 'completed'
+        ).scalar_subquery()
+        
+        statement = db.update(cls).values(
+            task_count=total,
+            completed_count=completed,
+            progress=progress_expression(total, completed)
+        )
+        if project_id is not None:
+            statement = statement.where(cls.id == project_id)
+        return db.session.execute(statement).rowcount
     
     def to_dict(self):
         return {
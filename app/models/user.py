@@ -3,6 +3,7 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from app import db
+import json
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -16,6 +17,7 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False, default='user')  # 'admin' or 'user'
     is_active = db.Column(db.Boolean, default=True)
     profile_picture = db.Column(db.String(200), default='default-avatar.png')
+    profile_picture_variants = db.Column(db.Text)  # JSON list of resized renditions of profile_picture
     bio = db.Column(db.Text)
     phone = db.Column(db.String(20))
     department = db.Column(db.String(100))
@@ -40,6 +42,14 @@ class User(UserMixin, db.Model):
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
     
+    def get_profile_picture_variants(self):
+        if self.profile_picture_variants:
+            return json.loads(self.profile_picture_variants)
+        return []
+    
+    def set_profile_picture_variants(self, variants):
+        self.profile_picture_variants = json.dumps(variants) if variants is not None else None
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -50,6 +60,7 @@ class User(UserMixin, db.Model):
             'role': self.role,
             'is_active': self.is_active,
             'profile_picture': self.profile_picture,
+            'profile_picture_variants': self.get_profile_picture_variants(),
             'bio': self.bio,
             'phone': self.phone,
             'department': self.department,
@@ -5,7 +5,11 @@ from app import db
 from app.models.user import User
 from app.models.project import Project
 from app.models.task import Task
-from app.models.canvas import CanvasChatMessage, Canvas
+from app.utils.chat import chat_history_response, queue_chat_response
+from app.utils.channels import resolve_channel, release_project_channel
+from app.utils.stats import get_admin_stats
+from app.utils.principal import invalidate_principal
+from app.utils.search import search_hits
 from app.utils.forms import CreateUserForm, EditUserForm
 from datetime import datetime, timedelta
 
@@ -24,13 +28,10 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    # Get statistics
-    total_users = User.query.count()
-    active_users = User.query.filter_by(is_active=True).count()
-    total_projects = Project.query.count()
-    active_projects = Project.query.filter_by(status='active').count()
-    total_tasks = Task.query.count()
-    completed_tasks = Task.query.filter_by(status='completed').count()
+    # Get statistics (including logins in the last 30 days)
+    admin_stats = get_admin_stats()
+    total_tasks = admin_stats['total_tasks']
+    completed_tasks = admin_stats['completed_tasks']
 
     # Calculate task completion rate
     if total_tasks > 0:
@@ -41,16 +42,13 @@ def dashboard():
     # Recent activity
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     recent_projects = Project.query.order_by(Project.created_at.desc()).limit(5).all()
-
-    # User activity in last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_logins = User.query.filter(User.last_login >= thirty_days_ago).count()
+    recent_logins = admin_stats['recent_logins']
 
     stats = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'total_projects': total_projects,
-        'active_projects': active_projects,
+        'total_users': admin_stats['total_users'],
+        'active_users': admin_stats['active_users'],
+        'total_projects': admin_stats['total_projects'],
+        'active_projects': admin_stats['active_projects'],
         'total_tasks': total_tasks,
         'completed_tasks': completed_tasks,
         'task_completion_rate': task_completion_rate,
@@ -73,13 +71,11 @@ def users():
     
     query = User.query
     
+    order_by = [User.created_at.desc()]
     if search:
-        query = query.filter(
-            (User.username.contains(search)) |
-            (User.email.contains(search)) |
-            (User.first_name.contains(search)) |
-            (User.last_name.contains(search))
-        )
+        hits = search_hits('user', search)
+        query = query.join(hits, User.id == hits.c.entity_id)
+        order_by.insert(0, hits.c.rank)
     
     if role_filter:
         query = query.filter_by(role=role_filter)
@@ -89,7 +85,7 @@ def users():
     elif status_filter == 'inactive':
         query = query.filter_by(is_active=False)
     
-    users = query.order_by(User.created_at.desc()).paginate(
+    users = query.order_by(*order_by).paginate(
         page=page, per_page=20, error_out=False
     )
     
@@ -166,6 +162,7 @@ def edit_user(user_id):
             user.set_password(form.password.data)
         
         db.session.commit()
+        invalidate_principal(user.id)
         
         flash(f'User {user.username} updated successfully!', 'success')
         return redirect(url_for('admin.users'))
@@ -184,6 +181,7 @@ def delete_user(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        invalidate_principal(user_id)
         return jsonify({'success': True, 'message': 'User deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -201,6 +199,7 @@ def toggle_user_status(user_id):
     try:
         user.is_active = not user.is_active
         db.session.commit()
+        invalidate_principal(user.id)
         
         status = 'activated' if user.is_active else 'deactivated'
         return jsonify({'success': True, 'message': f'User {status} successfully'})
@@ -217,16 +216,16 @@ def projects():
     
     query = Project.query
     
+    order_by = [Project.created_at.desc()]
     if search:
-        query = query.filter(
-            (Project.title.contains(search)) |
-            (Project.description.contains(search))
-        )
+        hits = search_hits('project', search)
+        query = query.join(hits, Project.id == hits.c.entity_id)
+        order_by.insert(0, hits.c.rank)
     
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    projects = query.order_by(Project.created_at.desc()).all()
+    projects = query.order_by(*order_by).all()
     
     return render_template('admin/projects.html', projects=projects, search=search, status_filter=status_filter)
 
@@ -237,6 +236,7 @@ def delete_project(project_id):
     project = Project.query.get_or_404(project_id)
     
     try:
+        release_project_channel(project_id)
         db.session.delete(project)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Project deleted successfully'})
@@ -250,23 +250,9 @@ def delete_project(project_id):
 @admin_required
 def get_admin_chat_messages():
     # Create a special admin canvas for admin chat
-    admin_canvas = Canvas.query.filter_by(title='Admin Chat').first()
-    if not admin_canvas:
-        admin_canvas = Canvas(
-            title='Admin Chat',
-            created_by=current_user.id,
-            content='{"elements": [], "settings": {"theme": "light"}}'
-        )
-        db.session.add(admin_canvas)
-        db.session.commit()
-    
-    messages = CanvasChatMessage.query.filter_by(canvas_id=admin_canvas.id)\
-                                    .order_by(CanvasChatMessage.created_at.asc()).all()
+    admin_canvas_id = resolve_channel('admin', user_id=current_user.id)
     
-    return jsonify({
-        'success': True,
-        'messages': [message.to_dict() for message in messages]
-    })
+    return chat_history_response(admin_canvas_id)
 
 @admin_bp.route('/chat/messages', methods=['POST'])
 @login_required
@@ -274,32 +260,9 @@ def get_admin_chat_messages():
 def send_admin_chat_message():
     try:
         # Create a special admin canvas for admin chat
-        admin_canvas = Canvas.query.filter_by(title='Admin Chat').first()
-        if not admin_canvas:
-            admin_canvas = Canvas(
-                title='Admin Chat',
-                created_by=current_user.id,
-                content='{"elements": [], "settings": {"theme": "light"}}'
-            )
-            db.session.add(admin_canvas)
-            db.session.commit()
-        
-        data = request.get_json()
-        
-        message = CanvasChatMessage(
-            canvas_id=admin_canvas.id,
-            user_id=current_user.id,
-            message=data.get('message', ''),
-            message_type=data.get('message_type', 'text')
-        )
-        
-        db.session.add(message)
-        db.session.commit()
+        admin_canvas_id = resolve_channel('admin', user_id=current_user.id)
         
-        return jsonify({
-            'success': True,
-            'message': message.to_dict()
-        })
+        return queue_chat_response(admin_canvas_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
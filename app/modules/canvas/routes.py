@@ -1,21 +1,37 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
-import json
-import requests
-import urllib.parse
+import math
+import uuid
+import hashlib
 from datetime import datetime
-from app import db, socketio
-from app.models.canvas import Canvas, CanvasElement, CanvasChatMessage, CanvasFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
+from app import db, socketio, derivative_pipeline, image_generator
+from app.models.canvas import Canvas, CanvasElement, CanvasFile, CanvasBlob, validate_operations, diff_content, content_in_viewport
 from app.models.project import Project
 from app.models.user import User
 from app.models.invitation import ProjectMember
+from app.utils.chat import chat_history_response, queue_chat_response
+from app.utils.channels import resolve_channel
+from app.utils.uploads import (
+    upload_tmp_folder, session_paths, create_upload_session, load_upload_session, discard_upload_session,
+    stream_to_file, append_upload_chunk, finish_upload_hash, store_blob
+)
+from app.utils.derivatives import is_image
+from app.utils.imagegen import QueueFullError
+from app.utils.oplog import record_canvas_revision, canvas_events_since
+from app.utils.protocol import emit_realtime
+from app.utils.access import can_read_project, can_write_project, get_project_role, get_project_permissions
 
 canvas_bp = Blueprint('canvas', __name__)
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'svg', 'webp', 'bmp', 'tiff'}
 
+# Suggested chunk size for resumable uploads; each chunk is one request, so it must stay under MAX_CONTENT_LENGTH
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -25,17 +41,65 @@ def ensure_upload_folder():
         os.makedirs(upload_folder)
     return upload_folder
 
+# Canvases without a project are the global/admin chat channels, served by their own routes
 def has_canvas_write_permission(project, user):
-    if user.is_admin() or project.created_by == user.id:
-        return True
-    member = ProjectMember.query.filter_by(project_id=project.id, user_id=user.id).first()
-    return member and ('write' in member.permissions or 'create' in member.permissions)
+    return project is not None and can_write_project(project, user)
 
 def has_canvas_read_permission(project, user):
-    if user.is_admin() or project.created_by == user.id:
-        return True
-    member = ProjectMember.query.filter_by(project_id=project.id, user_id=user.id).first()
-    return member is not None
+    return project is not None and can_read_project(project, user)
+
+def add_canvas_file(canvas_id, blob, original_filename, extension):
+    # filename stays relative to /static/uploads/canvas/, which is where clients build file URLs from
+    canvas_file = CanvasFile(
+        canvas_id=canvas_id,
+        blob_id=blob.id,
+        filename=blob.storage_path[len('canvas/'):],
+        original_filename=original_filename,
+        file_path=f'/static/uploads/{blob.storage_path}',
+        file_type=extension,
+        file_size=blob.size,
+        uploaded_by=current_user.id
+    )
+    db.session.add(canvas_file)
+    db.session.flush()
+    return canvas_file
+
+def queue_blob_derivatives(blob):
+    # Rendered once per distinct image; a duplicate upload reuses the blob's renditions
+    if blob.derivatives is not None or not is_image(blob.storage_path):
+        return
+    
+    blob_id = blob.id
+    def record(variants):
+        stored = db.session.get(CanvasBlob, blob_id)
+        if stored and stored.derivatives is None:
+            stored.set_derivatives_json(variants)
+    
+    source_path = os.path.join(current_app.config['UPLOAD_FOLDER'], blob.storage_path)
+    derivative_pipeline.submit(source_path, record)
+
+def canvas_file_response(canvas_file):
+    return {
+        'success': True,
+        'file': canvas_file.to_dict(),
+        'url': canvas_file.file_path,
+        'filename': canvas_file.filename,
+        'original_filename': canvas_file.original_filename,
+        'file_type': canvas_file.file_type,
+        'file_size': canvas_file.file_size
+    }
+
+def revision_conflict_response(canvas, base_revision):
+    # Send only the operations the client missed, or resync when the log no longer reaches back that far
+    events = canvas_events_since(canvas, base_revision)
+    
+    return jsonify({
+        'success': False,
+        'message': 'Canvas has changed since base revision',
+        'revision': events['revision'],
+        'resync': events['resync'],
+        'operations': events['operations']
+    }), 409
 
 @canvas_bp.route('/project/<int:project_id>')
 @login_required
@@ -50,16 +114,7 @@ def project_canvas(project_id):
     
     
     # Get or create canvas for this project
-    canvas = Canvas.query.filter_by(project_id=project_id).first()
-    if not canvas:
-        canvas = Canvas(
-            project_id=project_id,
-            title=f"{project.title} - Canvas",
-            created_by=current_user.id,
-            content=json.dumps({'elements': [], 'settings': {'theme': 'light'}})
-        )
-        db.session.add(canvas)
-        db.session.commit()
+    canvas = db.session.get(Canvas, resolve_channel('project', project_id, current_user.id, f"{project.title} - Canvas"))
     
     # Get all project team members for chat
     team_members_query = User.query.join(ProjectMember, User.id == ProjectMember.user_id)\
@@ -76,18 +131,8 @@ def project_canvas(project_id):
     team_members_serialized = [user.to_dict() for user in team_members]
 
     # Get current user's role and permissions for this project
-    member = ProjectMember.query.filter_by(project_id=project.id, user_id=current_user.id).first()
-    user_role = 'admin' if current_user.is_admin() else (
-        'owner' if project.created_by == current_user.id else (member.role if member else 'member')
-    )
-    
-    # Fix permissions - ensure project members have proper access
-    if current_user.is_admin() or project.created_by == current_user.id:
-        user_permissions = ['read', 'write', 'create', 'delete']
-    elif member:
-        user_permissions = member.permissions.split(',') if member.permissions else ['read', 'write']
-    else:
-        user_permissions = ['read']
+    user_role = get_project_role(project, current_user)
+    user_permissions = get_project_permissions(project, current_user)
 
     return render_template('canvas/canvas.html', 
         canvas=canvas, 
@@ -108,21 +153,72 @@ def save_canvas(canvas_id):
     
     try:
         data = request.get_json()
-        canvas.set_content_json(data.get('content', {}))
-        canvas.last_saved = datetime.utcnow()
-        canvas.updated_at = datetime.utcnow()
+        content = data.get('content', {})
+        if not isinstance(content, dict):
+            return jsonify({'success': False, 'message': 'content must be an object'}), 400
+        
+        # Logged as the operations since the previous revision, so clients can replay the save
+        operations = diff_content(canvas.get_current_content_json(), content)
+        canvas.set_content_json(content)
+        record_canvas_revision(canvas, current_user.id, operations, snapshot=True)
         
         db.session.commit()
         
         return jsonify({
             'success': True, 
             'message': 'Canvas saved successfully',
+            'revision': canvas.revision,
             'last_saved': canvas.last_saved.isoformat()
         })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@canvas_bp.route('/api/canvas/<int:canvas_id>/patch', methods=['POST'])
+@login_required
+def patch_canvas(canvas_id):
+    # The content column is only read if this patch triggers compaction
+    canvas = Canvas.query.options(defer(Canvas.content)).get_or_404(canvas_id)
+    
+    if not has_canvas_write_permission(canvas.project, current_user):
+        return jsonify({'success': False, 'message': 'Access denied - you do not have write permission'}), 403
+    
+    data = request.get_json() or {}
+    base_revision = data.get('base_revision')
+    operations = data.get('operations')
+    
+    if not isinstance(base_revision, int) or not isinstance(operations, list):
+        return jsonify({'success': False, 'message': 'base_revision and a list of operations are required'}), 400
+    
+    if base_revision != canvas.revision:
+        return revision_conflict_response(canvas, base_revision)
+    
+    # Only the shape is checked here, so a patch never loads the board; compaction and reads fold the log
+    try:
+        validate_operations(operations)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        record_canvas_revision(canvas, current_user.id, operations)
+        # Read before commit, which expires the canvas and would reload it in full
+        revision, last_saved = canvas.revision, canvas.last_saved
+        db.session.commit()
+    except IntegrityError:
+        # Another writer claimed this revision first
+        db.session.rollback()
+        canvas = Canvas.query.options(defer(Canvas.content)).get_or_404(canvas_id)
+        return revision_conflict_response(canvas, base_revision)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'revision': revision,
+        'last_saved': last_saved.isoformat()
+    })
+
 @canvas_bp.route('/api/canvas/<int:canvas_id>/load', methods=['GET'])
 @login_required
 def load_canvas(canvas_id):
@@ -134,11 +230,27 @@ def load_canvas(canvas_id):
     
     return jsonify({
         'success': True,
-        'content': canvas.get_content_json(),
+        'content': canvas.get_current_content_json(),
         'title': canvas.title,
+        'revision': canvas.revision,
         'last_saved': canvas.last_saved.isoformat() if canvas.last_saved else None
     })
 
+@canvas_bp.route('/api/canvas/<int:canvas_id>/events', methods=['GET'])
+@login_required
+def get_canvas_events(canvas_id):
+    canvas = Canvas.query.get_or_404(canvas_id)
+    
+    if not has_canvas_read_permission(canvas.project, current_user):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'success': False, 'message': 'since revision is required'}), 400
+    
+    # resync means the log no longer reaches back to `since`; reload through /load instead
+    return jsonify(dict(canvas_events_since(canvas, since), success=True))
+
 @canvas_bp.route('/api/canvas/<int:canvas_id>/elements', methods=['GET'])
 @login_required
 def get_canvas_elements(canvas_id):
@@ -154,6 +266,83 @@ def get_canvas_elements(canvas_id):
         'elements': [element.to_dict() for element in elements]
     })
 
+VIEWPORT_PAGE_SIZE = 500
+VIEWPORT_MAX_PAGE_SIZE = 2000
+
+# With a zoom level, elements smaller than this many screen pixels are left out
+VIEWPORT_MIN_SCREEN_PX = 2
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/elements/viewport', methods=['GET'])
+@login_required
+def get_canvas_viewport_elements(canvas_id):
+    canvas = Canvas.query.get_or_404(canvas_id)
+    
+    if not has_canvas_read_permission(canvas.project, current_user):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    # ?x1=&y1=&x2=&y2= in canvas coordinates, optional ?zoom=, then ?after_id= for the next page.
+    # ?source=content reads the board the canvas page edits (Canvas.content at its latest revision)
+    # and pages with ?offset= instead; the default reads the CanvasElement rows.
+    x1, y1, x2, y2 = (request.args.get(name, type=float) for name in ('x1', 'y1', 'x2', 'y2'))
+    if None in (x1, y1, x2, y2) or x2 < x1 or y2 < y1:
+        return jsonify({'success': False, 'message': 'A bounding box x1, y1, x2, y2 with x1 <= x2 and y1 <= y2 is required'}), 400
+    
+    zoom = request.args.get('zoom', type=float)
+    min_size = VIEWPORT_MIN_SCREEN_PX / zoom if zoom and zoom > 0 else None
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', VIEWPORT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, VIEWPORT_MAX_PAGE_SIZE))
+    
+    if request.args.get('source') == 'content':
+        offset = request.args.get('offset', 0, type=int)
+        elements, next_offset = content_in_viewport(canvas.get_current_content_json(), x1, y1, x2, y2,
+                                                    min_size=min_size, offset=offset, limit=limit)
+        return jsonify({
+            'success': True,
+            'elements': elements,
+            'revision': canvas.revision,
+            'has_more': next_offset is not None,
+            'next_offset': next_offset
+        })
+    
+    unmeasured = canvas.max_element_width is None or canvas.max_element_height is None
+    elements, has_more = CanvasElement.in_viewport(canvas, x1, y1, x2, y2, min_size=min_size, after_id=after_id, limit=limit)
+    
+    # Serialized before any commit, which would otherwise expire and reload every element
+    serialized = [element.to_dict() for element in elements]
+    if unmeasured:
+        # Keeps bounds measured for a canvas that predates them
+        db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'elements': serialized,
+        'has_more': has_more,
+        'next_after_id': elements[-1].id if has_more else None
+    })
+
+# Fields an element update may change and their types, shared by the single and batch endpoints
+ELEMENT_UPDATE_FIELDS = {'position_x': float, 'position_y': float, 'width': float, 'height': float, 'z_index': int}
+
+ELEMENT_DEFAULTS = {'position_x': 0, 'position_y': 0, 'width': 200, 'height': 100, 'z_index': 1}
+
+def element_fields(data, defaults=None):
+    # defaults overlaid with the update fields present in data, coerced; raises ValueError for a non-number
+    values = dict(defaults or {})
+    for field, kind in ELEMENT_UPDATE_FIELDS.items():
+        if field not in data:
+            continue
+        value = data[field]
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            values[field] = kind(value)
+            if not math.isfinite(values[field]):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+    return values
+
 @canvas_bp.route('/api/canvas/<int:canvas_id>/elements', methods=['POST'])
 @login_required
 def create_canvas_element(canvas_id):
@@ -164,20 +353,21 @@ def create_canvas_element(canvas_id):
     
     try:
         data = request.get_json()
+        try:
+            fields = element_fields(data, ELEMENT_DEFAULTS)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         element = CanvasElement(
             canvas_id=canvas_id,
             element_type=data.get('element_type', 'text'),
-            position_x=data.get('position_x', 0),
-            position_y=data.get('position_y', 0),
-            width=data.get('width', 200),
-            height=data.get('height', 100),
-            z_index=data.get('z_index', 1),
-            created_by=current_user.id
+            created_by=current_user.id,
+            **fields
         )
         
         element.set_content_json(data.get('content', {}))
         element.set_style_json(data.get('style', {}))
+        canvas.extend_element_bounds(element.width, element.height)
         
         db.session.add(element)
         db.session.commit()
@@ -200,13 +390,16 @@ def update_canvas_element(element_id):
     
     try:
         data = request.get_json()
+        try:
+            fields = element_fields(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        element.position_x = data.get('position_x', element.position_x)
-        element.position_y = data.get('position_y', element.position_y)
-        element.width = data.get('width', element.width)
-        element.height = data.get('height', element.height)
-        element.z_index = data.get('z_index', element.z_index)
+        for field, value in fields.items():
+            setattr(element, field, value)
         element.updated_at = datetime.utcnow()
+        if 'width' in data or 'height' in data:
+            element.canvas.extend_element_bounds(element.width, element.height)
         
         if 'content' in data:
             element.set_content_json(data['content'])
@@ -240,6 +433,107 @@ def delete_canvas_element(element_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+MAX_ELEMENT_BATCH_SIZE = 1000
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/elements/batch', methods=['POST'])
+@login_required
+def batch_canvas_elements(canvas_id):
+    canvas = Canvas.query.get_or_404(canvas_id)
+    
+    if not has_canvas_write_permission(canvas.project, current_user):
+        return jsonify({'success': False, 'message': 'Permission denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_ELEMENT_BATCH_SIZE:
+        return jsonify({'success': False, 'message': f'At most {MAX_ELEMENT_BATCH_SIZE} operations per batch'}), 400
+    
+    # Creates, updates and deletes are applied in bulk per kind, which only matches request order
+    # while no element is referenced twice, so such batches are rejected
+    creates, updates, delete_ids = [], [], []
+    referenced_ids = set()
+    now = datetime.utcnow()
+    for operation in operations:
+        op = operation.get('op') if isinstance(operation, dict) else None
+        element_id = operation.get('id') if op in ('update', 'delete') else None
+        if element_id in referenced_ids:
+            return jsonify({'success': False, 'message': f'Element {element_id} is referenced more than once in this batch'}), 400
+        if isinstance(element_id, int):
+            referenced_ids.add(element_id)
+        
+        try:
+            if op == 'create' and isinstance(operation.get('element', {}), dict):
+                fields = element_fields(operation.get('element') or {}, ELEMENT_DEFAULTS)
+            elif op == 'update':
+                fields = element_fields(operation)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'{e} in {operation}'}), 400
+        
+        if op == 'create' and isinstance(operation.get('element', {}), dict):
+            element_data = operation.get('element') or {}
+            element = CanvasElement(
+                canvas_id=canvas_id,
+                element_type=element_data.get('element_type', 'text'),
+                created_by=current_user.id,
+                **fields
+            )
+            element.set_content_json(element_data.get('content', {}))
+            element.set_style_json(element_data.get('style', {}))
+            creates.append(element)
+        elif op == 'update' and isinstance(operation.get('id'), int):
+            mapping = dict(fields, id=operation['id'], updated_at=now)
+            if 'content' in operation:
+                mapping.update(CanvasElement.pack_content(operation['content']))
+            if 'style' in operation:
+                mapping.update(CanvasElement.pack_style(operation['style']))
+            updates.append(mapping)
+        elif op == 'delete' and isinstance(operation.get('id'), int):
+            delete_ids.append(operation['id'])
+        else:
+            return jsonify({'success': False, 'message': f'Invalid operation: {operation}'}), 400
+    
+    # Every referenced element must belong to this canvas, checked with one query
+    if referenced_ids:
+        found_ids = {row.id for row in db.session.query(CanvasElement.id).filter(
+            CanvasElement.canvas_id == canvas_id,
+            CanvasElement.id.in_(referenced_ids)
+        )}
+        missing_ids = sorted(referenced_ids - found_ids)
+        if missing_ids:
+            return jsonify({'success': False, 'message': 'Elements not found on this canvas', 'missing_ids': missing_ids}), 404
+    
+    widths = [element.width for element in creates] + [mapping['width'] for mapping in updates if 'width' in mapping]
+    heights = [element.height for element in creates] + [mapping['height'] for mapping in updates if 'height' in mapping]
+    
+    try:
+        db.session.add_all(creates)
+        if widths or heights:
+            canvas.extend_element_bounds(max(widths, default=0), max(heights, default=0))
+        if updates:
+            db.session.bulk_update_mappings(CanvasElement, updates)
+        if delete_ids:
+            CanvasElement.query.filter(
+                CanvasElement.canvas_id == canvas_id,
+                CanvasElement.id.in_(delete_ids)
+            ).delete(synchronize_session=False)
+        
+        # Serialized before commit, which would otherwise expire and reload every new row
+        db.session.flush()
+        created = [element.to_dict() for element in creates]
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'created': created,
+            'updated': [mapping['id'] for mapping in updates],
+            'deleted': delete_ids
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @canvas_bp.route('/api/canvas/<int:canvas_id>/chat/messages', methods=['GET'])
 @login_required
 def get_chat_messages(canvas_id):
@@ -249,13 +543,7 @@ def get_chat_messages(canvas_id):
     if not has_canvas_read_permission(canvas.project, current_user):
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
-    messages = CanvasChatMessage.query.filter_by(canvas_id=canvas_id)\
-                                    .order_by(CanvasChatMessage.created_at.asc()).all()
-    
-    return jsonify({
-        'success': True,
-        'messages': [message.to_dict() for message in messages]
-    })
+    return chat_history_response(canvas_id)
 
 @canvas_bp.route('/api/canvas/<int:canvas_id>/chat/messages', methods=['POST'])
 @login_required
@@ -265,26 +553,7 @@ def send_chat_message(canvas_id):
     if not has_canvas_read_permission(canvas.project, current_user):
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
     
-    try:
-        data = request.get_json()
-        
-        message = CanvasChatMessage(
-            canvas_id=canvas_id,
-            user_id=current_user.id,
-            message=data.get('message', ''),
-            message_type=data.get('message_type', 'text')
-        )
-        
-        db.session.add(message)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': message.to_dict()
-        })
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'message': str(e)}), 500
+    return queue_chat_response(canvas_id)
 
 # Project Chat endpoints (for project-wide chat)
 @canvas_bp.route('/api/project/<int:project_id>/chat/messages', methods=['GET'])
@@ -297,24 +566,9 @@ def get_project_chat_messages(project_id):
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
     # Get or create canvas for project chat
-    canvas = Canvas.query.filter_by(project_id=project_id).first()
-    if not canvas:
-        canvas = Canvas(
-            project_id=project_id,
-            title=f"{project.title} - Canvas",
-            created_by=current_user.id,
-            content=json.dumps({'elements': [], 'settings': {'theme': 'light'}})
-        )
-        db.session.add(canvas)
-        db.session.commit()
-    
-    messages = CanvasChatMessage.query.filter_by(canvas_id=canvas.id)\
-                                    .order_by(CanvasChatMessage.created_at.asc()).all()
+    canvas_id = resolve_channel('project', project_id, current_user.id, f"{project.title} - Canvas")
     
-    return jsonify({
-        'success': True,
-        'messages': [message.to_dict() for message in messages]
-    })
+    return chat_history_response(canvas_id)
 
 @canvas_bp.route('/api/project/<int:project_id>/chat/messages', methods=['POST'])
 @login_required
@@ -326,33 +580,9 @@ def send_project_chat_message(project_id):
     
     try:
         # Get or create canvas for project chat
-        canvas = Canvas.query.filter_by(project_id=project_id).first()
-        if not canvas:
-            canvas = Canvas(
-                project_id=project_id,
-                title=f"{project.title} - Canvas",
-                created_by=current_user.id,
-                content=json.dumps({'elements': [], 'settings': {'theme': 'light'}})
-            )
-            db.session.add(canvas)
-            db.session.commit()
-        
-        data = request.get_json()
+        canvas_id = resolve_channel('project', project_id, current_user.id, f"{project.title} - Canvas")
         
-        message = CanvasChatMessage(
-            canvas_id=canvas.id,
-            user_id=current_user.id,
-            message=data.get('message', ''),
-            message_type=data.get('message_type', 'text')
-        )
-        
-        db.session.add(message)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': message.to_dict()
-        })
+        return queue_chat_response(canvas_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -374,39 +604,19 @@ def upload_file(canvas_id):
     
     if file and allowed_file(file.filename):
         try:
-            upload_folder = ensure_upload_folder()
-            
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
+            # Streamed to a temp file while hashing, then stored once per distinct content
+            part_path = os.path.join(upload_tmp_folder(), f'{uuid.uuid4().hex}.part')
+            hasher = hashlib.sha256()
+            with open(part_path, 'wb') as part:
+                file_size = stream_to_file(file.stream, part, hasher)
             
-            file_path = os.path.join(upload_folder, filename)
-            file.save(file_path)
-            
-            # Save file info to database
-            canvas_file = CanvasFile(
-                canvas_id=canvas_id,
-                filename=filename,
-                original_filename=file.filename,
-                file_path=f'/static/uploads/canvas/{filename}',
-                file_type=file.filename.rsplit('.', 1)[1].lower(),
-                file_size=os.path.getsize(file_path),
-                uploaded_by=current_user.id
-            )
-            
-            db.session.add(canvas_file)
+            extension = file.filename.rsplit('.', 1)[1].lower()
+            blob = store_blob(part_path, hasher.hexdigest(), file_size, extension)
+            canvas_file = add_canvas_file(canvas_id, blob, file.filename, extension)
             db.session.commit()
+            queue_blob_derivatives(blob)
             
-            return jsonify({
-                'success': True,
-                'file': canvas_file.to_dict(),
-                'url': f'/static/uploads/canvas/{filename}',
-                'filename': filename,
-                'original_filename': file.filename,
-                'file_type': canvas_file.file_type,
-                'file_size': canvas_file.file_size
-            })
+            return jsonify(canvas_file_response(canvas_file))
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"File upload error: {str(e)}")
@@ -414,6 +624,93 @@ def upload_file(canvas_id):
     
     return jsonify({'success': False, 'message': 'File type not allowed'}), 400
 
+def get_upload_session_or_404(canvas_id, upload_id):
+    session = load_upload_session(upload_id)
+    if not session or session['canvas_id'] != canvas_id or session['user_id'] != current_user.id:
+        abort(404)
+    return session
+
+# Resumable upload: POST to start, PUT raw chunks at ?offset=, GET to find the offset to resume from, then POST complete
+@canvas_bp.route('/api/canvas/<int:canvas_id>/uploads', methods=['POST'])
+@login_required
+def start_chunked_upload(canvas_id):
+    canvas = Canvas.query.get_or_404(canvas_id)
+    
+    if not has_canvas_write_permission(canvas.project, current_user):
+        return jsonify({'success': False, 'message': 'Permission denied'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    size = data.get('size')
+    
+    if not allowed_file(filename):
+        return jsonify({'success': False, 'message': 'File type not allowed'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'success': False, 'message': 'size must be a positive number of bytes'}), 400
+    if size > current_app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'success': False, 'message': 'File is too large'}), 413
+    
+    session = create_upload_session(canvas_id, current_user.id, filename, size)
+    return jsonify({
+        'success': True,
+        'upload_id': session['upload_id'],
+        'offset': 0,
+        'size': size,
+        'chunk_size': UPLOAD_CHUNK_SIZE
+    })
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(canvas_id, upload_id):
+    session = get_upload_session_or_404(canvas_id, upload_id)
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(canvas_id, upload_id):
+    session = get_upload_session_or_404(canvas_id, upload_id)
+    
+    offset = request.args.get('offset', type=int)
+    if offset != session['offset']:
+        return jsonify({'success': False, 'message': 'Chunk does not start at the current offset', 'offset': session['offset']}), 409
+    
+    try:
+        append_upload_chunk(session, request.stream)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e), 'offset': session['offset']}), 400
+    
+    return jsonify({'success': True, 'offset': session['offset'], 'size': session['size']})
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(canvas_id, upload_id):
+    session = get_upload_session_or_404(canvas_id, upload_id)
+    
+    if session['offset'] != session['size']:
+        return jsonify({'success': False, 'message': 'Upload is incomplete', 'offset': session['offset']}), 400
+    
+    try:
+        _, part_path = session_paths(upload_id)
+        extension = session['filename'].rsplit('.', 1)[1].lower()
+        blob = store_blob(part_path, finish_upload_hash(session), session['size'], extension)
+        canvas_file = add_canvas_file(canvas_id, blob, session['filename'], extension)
+        db.session.commit()
+        discard_upload_session(upload_id)
+        queue_blob_derivatives(blob)
+        
+        return jsonify(canvas_file_response(canvas_file))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"File upload error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Upload failed: {str(e)}'}), 500
+
+@canvas_bp.route('/api/canvas/<int:canvas_id>/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_chunked_upload(canvas_id, upload_id):
+    get_upload_session_or_404(canvas_id, upload_id)
+    discard_upload_session(upload_id)
+    return jsonify({'success': True, 'message': 'Upload cancelled'})
+
 @canvas_bp.route('/api/canvas/<int:canvas_id>/files', methods=['GET'])
 @login_required
 def get_canvas_files(canvas_id):
@@ -457,35 +754,28 @@ def generate_image(canvas_id):
         if width not in [256, 512, 768, 1024] or height not in [256, 512, 768, 1024]:
             return jsonify({'success': False, 'message': 'Invalid dimensions. Supported sizes: 256, 512, 768, 1024'}), 400
         
-        # URL encode the prompt for safe API usage
-        encoded_prompt = urllib.parse.quote(prompt)
-        
-        # Generate image URL using Pollinations AI
-        image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?model={model}&width={width}&height={height}"
-        
-        # Test if the image URL is accessible
         try:
-            response = requests.head(image_url, timeout=10)
-            if response.status_code != 200:
-                return jsonify({'success': False, 'message': 'Image generation service is currently unavailable'}), 503
-        except requests.RequestException:
-            return jsonify({'success': False, 'message': 'Unable to connect to image generation service'}), 503
+            job = image_generator.submit(canvas_id, current_user.id, current_user.get_full_name(),
+                                         prompt, width, height, model)
+        except QueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)}), 503
         
-        return jsonify({
-            'success': True,
-            'image_url': image_url,
-            'prompt': prompt,
-            'width': width,
-            'height': height,
-            'model': model,
-            'generated_at': datetime.utcnow().isoformat(),
-            'generated_by': current_user.get_full_name()
-        })
+        # Cached prompts complete immediately; otherwise the result arrives as image_generated on the canvas room
+        return jsonify(dict(job, success=True)), 200 if job['status'] == 'completed' else 202
         
     except Exception as e:
         current_app.logger.error(f"Image generation error: {str(e)}")
         return jsonify({'success': False, 'message': f'Image generation failed: {str(e)}'}), 500
 
+@canvas_bp.route('/api/canvas/<int:canvas_id>/generate_image/<job_id>', methods=['GET'])
+@login_required
+def get_image_generation_job(canvas_id, job_id):
+    job = image_generator.get_job(job_id)
+    if not job or job['canvas_id'] != canvas_id or job['user_id'] != current_user.id:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    return jsonify(dict(job, success=True))
+
 # Real-time collaboration endpoint
 @canvas_bp.route('/api/canvas/<int:canvas_id>/broadcast', methods=['POST'])
 @login_required
@@ -499,14 +789,14 @@ def broadcast_canvas_update(canvas_id):
         data = request.get_json()
         
         # Broadcast to all users in this canvas room
-        socketio.emit('canvas_update', {
+        emit_realtime(socketio, 'canvas_update', {
             'canvas_id': canvas_id,
             'user_id': current_user.id,
             'user_name': current_user.get_full_name(),
             'action': data.get('action'),
             'element_data': data.get('element_data'),
             'timestamp': datetime.utcnow().isoformat()
-        }, room=f'canvas_{canvas_id}')
+        }, canvas_id)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -6,6 +6,7 @@ from app.models.user import User
 from app.models.project import Project
 from app.models.task import Task
 from app.models.invitation import ProjectMember
+from app.utils.stats import get_user_stats, get_admin_stats
 from sqlalchemy import select
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -14,29 +15,24 @@ dashboard_bp = Blueprint('dashboard', __name__)
 @login_required
 def index():
     # Get user's statistics
+    user_stats = get_user_stats(current_user.id)
+    
     if current_user.is_admin():
         # Admin dashboard
-        total_users = User.query.count()
-        total_projects = Project.query.count()
-        total_tasks = Task.query.count()
+        admin_stats = get_admin_stats()
+        total_users = admin_stats['total_users']
+        total_projects = admin_stats['total_projects']
+        total_tasks = admin_stats['total_tasks']
         my_projects = Project.query.order_by(Project.created_at.desc()).limit(5).all()
         my_tasks = Task.query.order_by(Task.created_at.desc()).limit(5).all()
     else:
         # Regular user dashboard - include projects where user is member
         total_users = None
-        
-        # Count projects created by user OR where user is a member
-        member_project_ids = select(ProjectMember.project_id).filter_by(user_id=current_user.id)
-        total_projects = Project.query.filter(
-            db.or_(
-                Project.created_by == current_user.id,
-                Project.id.in_(member_project_ids)
-            )
-        ).count()
-        
-        total_tasks = Task.query.filter_by(assigned_to=current_user.id).count()
+        total_projects = user_stats['total_projects']
+        total_tasks = user_stats['total_tasks']
         
         # Get recent projects (created by user OR where user is member)
+        member_project_ids = select(ProjectMember.project_id).filter_by(user_id=current_user.id)
         my_projects = Project.query.filter(
             db.or_(
                 Project.created_by == current_user.id,
@@ -57,19 +53,12 @@ def index():
         Task.status != 'completed'
     ).order_by(Task.due_date.asc()).limit(5).all()
     
-    # Overdue tasks
-    overdue_tasks = Task.query.filter(
-        Task.assigned_to == current_user.id,
-        Task.due_date < datetime.utcnow(),
-        Task.status != 'completed'
-    ).count()
-    
     stats = {
         'total_users': total_users,
         'total_projects': total_projects,
         'total_tasks': total_tasks,
-        'overdue_tasks': overdue_tasks,
-        'completed_tasks': Task.query.filter_by(assigned_to=current_user.id, status='completed').count()
+        'overdue_tasks': user_stats['overdue_tasks'],
+        'completed_tasks': user_stats['completed_tasks']
     }
     
     return render_template('dashboard/index.html', 
@@ -5,6 +5,9 @@ from app import db
 from app.models.user import User
 from app.models.project import Project
 from app.models.invitation import ProjectInvitation, ProjectMember
+from app.utils.access import can_read_project, invalidate_membership
+from app.utils.stats import invalidate_stats
+from app.utils.search import search_hits
 
 invitations_bp = Blueprint('invitations', __name__)
 
@@ -23,20 +26,15 @@ def search_users():
         project_id=project_id, status='pending'
     ).subquery()
     
-    users = User.query.filter(
+    hits = search_hits('user', query)
+    users = User.query.join(hits, User.id == hits.c.entity_id).filter(
         db.and_(
             User.is_active == True,
             User.id != current_user.id,
             ~User.id.in_(existing_member_ids),
-            ~User.id.in_(pending_invitation_ids),
-            db.or_(
-                User.username.ilike(f'%{query}%'),
-                User.email.ilike(f'%{query}%'),
-                User.first_name.ilike(f'%{query}%'),
-                User.last_name.ilike(f'%{query}%')
-            )
+            ~User.id.in_(pending_invitation_ids)
         )
-    ).limit(10).all()
+    ).order_by(hits.c.rank).limit(10).all()
     
     return jsonify({
         'users': [{
@@ -136,6 +134,8 @@ def respond_to_invitation(invitation_id):
     
     invitation.responded_at = datetime.utcnow()
     db.session.commit()
+    invalidate_membership(invitation.project_id, current_user.id)
+    invalidate_stats(current_user.id)
     
     return jsonify({
         'success': True,
@@ -158,8 +158,7 @@ def project_members(project_id):
     project = Project.query.get_or_404(project_id)
     
     # Check if user has access to view members
-    if not (current_user.is_admin() or project.created_by == current_user.id or 
-            ProjectMember.query.filter_by(project_id=project_id, user_id=current_user.id).first()):
+    if not can_read_project(project, current_user):
         flash('Access denied.', 'error')
         return redirect(url_for('projects.index'))
     
@@ -185,10 +184,14 @@ def remove_member(member_id):
     if member.user_id == project.created_by:
         return jsonify({'success': False, 'message': 'Cannot remove project owner'}), 400
     
+    project_id, user_id = member.project_id, member.user_id
+    member_name = member.user.get_full_name()
     db.session.delete(member)
     db.session.commit()
+    invalidate_membership(project_id, user_id)
+    invalidate_stats(user_id)
     
     return jsonify({
         'success': True,
-        'message': f'{member.user.get_full_name()} removed from project'
+        'message': f'{member_name} removed from project'
     })
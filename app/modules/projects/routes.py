@@ -7,6 +7,9 @@ from app.models.task import Task
 from app.models.user import User
 from app.utils.forms import ProjectForm, TaskForm
 from app.models.invitation import ProjectMember
+from app.utils.access import can_read_project
+from app.utils.stats import invalidate_stats
+from app.utils.search import search_hits
 
 projects_bp = Blueprint('projects', __name__)
 
@@ -30,13 +33,17 @@ def index():
             )
         )
     
+    # Best matches first when searching, newest first otherwise
+    order_by = [Project.created_at.desc()]
     if search:
-        query = query.filter(Project.title.contains(search))
+        hits = search_hits('project', search)
+        query = query.join(hits, Project.id == hits.c.entity_id)
+        order_by.insert(0, hits.c.rank)
     
     if status_filter:
         query = query.filter(Project.status == status_filter)
     
-    projects = query.order_by(Project.created_at.desc()).paginate(
+    projects = query.order_by(*order_by).paginate(
         page=page, per_page=12, error_out=False
     )
     
@@ -60,6 +67,7 @@ def create():
         
         db.session.add(project)
         db.session.commit()
+        invalidate_stats(current_user.id)
         
         flash('Project created successfully!', 'success')
         return redirect(url_for('projects.view', project_id=project.id))
@@ -72,18 +80,10 @@ def view(project_id):
     project = Project.query.get_or_404(project_id)
     
     # Check if user can view this project
-    if not (
-        current_user.is_admin() or
-        project.created_by == current_user.id or
-        ProjectMember.query.filter_by(project_id=project.id, user_id=current_user.id).first()
-    ):
+    if not can_read_project(project, current_user):
         flash('Access denied.', 'error')
         return redirect(url_for('projects.index'))
     
-    # Update project progress
-    project.progress = project.calculate_progress()
-    db.session.commit()
-    
     tasks = Task.query.filter_by(project_id=project.id).order_by(Task.created_at.desc()).all()
     
     return render_template('projects/view.html', project=project, tasks=tasks)
@@ -120,11 +120,7 @@ def create_task(project_id):
     project = Project.query.get_or_404(project_id)
     
     # Check if user can create tasks for this project
-    if not (
-        current_user.is_admin() or 
-        project.created_by == current_user.id or
-        ProjectMember.query.filter_by(project_id=project.id, user_id=current_user.id).first()
-    ):
+    if not can_read_project(project, current_user):
         flash('Access denied.', 'error')
         return redirect(url_for('projects.view', project_id=project_id))
     
@@ -146,7 +142,9 @@ def create_task(project_id):
         )
         
         db.session.add(task)
+        project.apply_task_delta(total_delta=1, completed_delta=int(task.status == 'completed'))
         db.session.commit()
+        invalidate_stats(task.assigned_to)
         
         flash('Task created successfully!', 'success')
         return redirect(url_for('projects.view', project_id=project_id))
@@ -166,10 +164,34 @@ def update_task_status(task_id):
     if status not in ['pending', 'in_progress', 'completed', 'cancelled']:
         return jsonify({'success': False, 'message': 'Invalid status'}), 400
     
+    task.project.record_task_status_change(task.status, status)
     task.status = status
     if status == 'completed':
         task.completed_date = datetime.utcnow()
     
     db.session.commit()
+    invalidate_stats(task.assigned_to)
     
     return jsonify({'success': True, 'message': 'Task status updated successfully'})
+
+@projects_bp.route('/tasks/<int:task_id>/delete', methods=['POST'])
+@login_required
+def delete_task(task_id):
+    task = Task.query.get_or_404(task_id)
+    project = task.project
+    
+    # Only the task creator, project owner or an admin can delete a task
+    if not current_user.is_admin() and task.created_by != current_user.id and project.created_by != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        assigned_to = task.assigned_to
+        project.apply_task_delta(total_delta=-1, completed_delta=-int(task.status == 'completed'))
+        db.session.delete(task)
+        db.session.commit()
+        invalidate_stats(assigned_to)
+        
+        return jsonify({'success': True, 'message': 'Task deleted successfully'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
@@ -0,0 +1,54 @@
+from flask import Blueprint, current_app, abort, send_file
+from werkzeug.security import safe_join
+import os
+import re
+from app.utils.cache import TTLCache
+from app.utils.uploads import file_sha256
+
+uploads_bp = Blueprint('uploads', __name__)
+
+# Content-addressed blobs and their renditions carry their sha256 in the file name
+CONTENT_ADDRESSED_PATTERN = re.compile(r'^canvas/blobs/[0-9a-f]{2}/([0-9a-f]{64})(\.\d+)?\.\w+$')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# sha256 of files whose name doesn't carry one, keyed by (path, mtime, size) so a rewritten file is re-hashed
+file_etag_cache = TTLCache(ttl=24 * 3600, maxsize=20000)
+
+def file_etag(path, stat):
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    etag = file_etag_cache.get(key)
+    if etag is None:
+        etag = file_sha256(path)
+        file_etag_cache.set(key, etag)
+    return etag
+
+# Registered as /static/uploads/<path>, which takes precedence over the generic static route
+@uploads_bp.route('/static/uploads/<path:filename>')
+def serve_upload(filename):
+    # Partial resumable uploads are never served
+    if filename.startswith('tmp/'):
+        abort(404)
+    
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    stat = os.stat(path)
+    match = CONTENT_ADDRESSED_PATTERN.match(filename)
+    if match:
+        # Same digest in the name, so the ETag is free; renditions add their size to stay distinct
+        etag = match.group(1) + (match.group(2) or '')
+        max_age = IMMUTABLE_MAX_AGE
+    else:
+        etag = file_etag(path, stat)
+        max_age = 0
+    
+    # conditional=True answers If-None-Match with 304 and Range with 206; USE_X_SENDFILE hands the body to the proxy
+    response = send_file(path, conditional=True, etag=etag, max_age=max_age, last_modified=stat.st_mtime)
+    if match:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -3,9 +3,12 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
-from app import db
+from app import db, derivative_pipeline
 from app.models.user import User
-from app.models.canvas import CanvasChatMessage, Canvas
+from app.utils.chat import chat_history_response, queue_chat_response
+from app.utils.channels import resolve_channel
+from app.utils.principal import invalidate_principal
+from app.utils.derivatives import remove_derivatives
 from app.utils.forms import ProfileForm, ChangePasswordForm
 
 users_bp = Blueprint('users', __name__)
@@ -29,23 +32,25 @@ def profile():
 @users_bp.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
-    form = ProfileForm(obj=current_user)
+    user = current_user.get_record()
+    form = ProfileForm(obj=user)
     
     if form.validate_on_submit():
         # Check if email already exists (excluding current user)
-        if form.email.data != current_user.email and User.query.filter_by(email=form.email.data).first():
+        if form.email.data != user.email and User.query.filter_by(email=form.email.data).first():
             flash('Email already registered.', 'error')
             return render_template('users/edit_profile.html', form=form)
         
-        current_user.first_name = form.first_name.data
-        current_user.last_name = form.last_name.data
-        current_user.email = form.email.data
-        current_user.phone = form.phone.data
-        current_user.department = form.department.data
-        current_user.job_title = form.job_title.data
-        current_user.bio = form.bio.data
+        user.first_name = form.first_name.data
+        user.last_name = form.last_name.data
+        user.email = form.email.data
+        user.phone = form.phone.data
+        user.department = form.department.data
+        user.job_title = form.job_title.data
+        user.bio = form.bio.data
         
         db.session.commit()
+        invalidate_principal(user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('users.profile'))
     
@@ -61,7 +66,7 @@ def change_password():
             flash('Current password is incorrect.', 'error')
             return render_template('users/change_password.html', form=form)
         
-        current_user.set_password(form.new_password.data)
+        current_user.get_record().set_password(form.new_password.data)
         db.session.commit()
         flash('Password changed successfully!', 'success')
         return redirect(url_for('users.profile'))
@@ -82,11 +87,14 @@ def upload_profile_picture():
         try:
             avatar_folder = ensure_avatar_folder()
             
-            # Delete old profile picture if it's not the default
-            if current_user.profile_picture and current_user.profile_picture != 'default-avatar.png':
-                old_file_path = os.path.join(avatar_folder, current_user.profile_picture)
+            user = current_user.get_record()
+            
+            # Delete old profile picture and its renditions if it's not the default
+            if user.profile_picture and user.profile_picture != 'default-avatar.png':
+                old_file_path = os.path.join(avatar_folder, user.profile_picture)
                 if os.path.exists(old_file_path):
                     os.remove(old_file_path)
+                remove_derivatives(user.get_profile_picture_variants(), current_app.config['UPLOAD_FOLDER'])
             
             filename = secure_filename(file.filename)
             # Add user ID and timestamp to avoid conflicts
@@ -97,8 +105,18 @@ def upload_profile_picture():
             file.save(file_path)
             
             # Update user's profile picture
-            current_user.profile_picture = filename
+            user.profile_picture = filename
+            user.set_profile_picture_variants(None)
             db.session.commit()
+            invalidate_principal(user.id)
+            
+            user_id = user.id
+            def record(variants):
+                stored = db.session.get(User, user_id)
+                # Skipped if the picture was replaced again while rendering
+                if stored and stored.profile_picture == filename:
+                    stored.set_profile_picture_variants(variants)
+            derivative_pipeline.submit(file_path, record)
             
             return jsonify({
                 'success': True,
@@ -117,55 +135,18 @@ def upload_profile_picture():
 @login_required
 def get_global_chat_messages():
     # Create a special global canvas for global chat
-    global_canvas = Canvas.query.filter_by(title='Global Chat').first()
-    if not global_canvas:
-        global_canvas = Canvas(
-            title='Global Chat',
-            created_by=current_user.id,
-            content='{"elements": [], "settings": {"theme": "light"}}'
-        )
-        db.session.add(global_canvas)
-        db.session.commit()
+    global_canvas_id = resolve_channel('global', user_id=current_user.id)
     
-    messages = CanvasChatMessage.query.filter_by(canvas_id=global_canvas.id)\
-                                    .order_by(CanvasChatMessage.created_at.asc()).all()
-    
-    return jsonify({
-        'success': True,
-        'messages': [message.to_dict() for message in messages]
-    })
+    return chat_history_response(global_canvas_id)
 
 @users_bp.route('/global-chat/messages', methods=['POST'])
 @login_required
 def send_global_chat_message():
     try:
         # Create a special global canvas for global chat
-        global_canvas = Canvas.query.filter_by(title='Global Chat').first()
-        if not global_canvas:
-            global_canvas = Canvas(
-                title='Global Chat',
-                created_by=current_user.id,
-                content='{"elements": [], "settings": {"theme": "light"}}'
-            )
-            db.session.add(global_canvas)
-            db.session.commit()
-        
-        data = request.get_json()
-        
-        message = CanvasChatMessage(
-            canvas_id=global_canvas.id,
-            user_id=current_user.id,
-            message=data.get('message', ''),
-            message_type=data.get('message_type', 'text')
-        )
-        
-        db.session.add(message)
-        db.session.commit()
+        global_canvas_id = resolve_channel('global', user_id=current_user.id)
         
-        return jsonify({
-            'success': True,
-            'message': message.to_dict()
-        })
+        return queue_chat_response(global_canvas_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1,8 +1,30 @@
+from flask import request
 from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
-from app import socketio
+from app import socketio, cursor_aggregator, canvas_log, presence, chat_writer
+from app.utils.oplog import get_canvas_project, to_operation, canvas_events_since
+from app.utils.access import can_read_project, can_write_project
+from app.utils.chatwriter import ChatQueueFullError
+from app.utils.protocol import PROTOCOLS, protocol_room, protocol_description, decode_payload, emit_realtime
 import json
 
+def emit_canvas_sync(canvas_id, since):
+    from app.models.canvas import Canvas
+    project = get_canvas_project(canvas_id)
+    if project is None or not can_read_project(project, current_user):
+        return
+    canvas = Canvas.query.get(canvas_id)
+    if canvas:
+        emit('canvas_sync', canvas_events_since(canvas, since))
+
+def emit_user_left(canvas_id, user_id, user_name):
+    cursor_aggregator.forget(canvas_id, user_id)
+    emit('user_left', {
+        'user_id': user_id,
+        'user_name': user_name,
+        'canvas_id': canvas_id
+    }, room=f"canvas_{canvas_id}", include_self=False)
+
 @socketio.on('join_canvas')
 def handle_join_canvas(data):
     canvas_id = data.get('canvas_id')
@@ -10,12 +32,30 @@ def handle_join_canvas(data):
         room = f"canvas_{canvas_id}"
         join_room(room)
         
-        # Notify others that user joined
-        emit('user_joined', {
-            'user_id': current_user.id,
-            'user_name': current_user.get_full_name(),
-            'canvas_id': canvas_id
-        }, room=room, include_self=False)
+        # High-frequency events go out per encoding; compact clients get the code tables once
+        protocol = data.get('protocol') if data.get('protocol') in PROTOCOLS else 'json'
+        for other in PROTOCOLS:
+            if other != protocol:
+                leave_room(protocol_room(canvas_id, other))
+        join_room(protocol_room(canvas_id, protocol))
+        if protocol == 'compact':
+            emit('protocol', protocol_description())
+        
+        # Notify others only on the user's first connection (tab) in the room
+        if presence.join(canvas_id, request.sid, current_user.id, current_user.get_full_name(), protocol):
+            emit('user_joined', {
+                'user_id': current_user.id,
+                'user_name': current_user.get_full_name(),
+                'canvas_id': canvas_id
+            }, room=room, include_self=False)
+        
+        # Who's here, so the client doesn't have to rebuild presence from join/leave events
+        emit('presence_snapshot', presence.snapshot(canvas_id))
+        
+        # A reconnecting client sends the last revision it applied and gets only what it missed
+        since = data.get('since')
+        if isinstance(since, int):
+            emit_canvas_sync(canvas_id, since)
         
         print(f"User {current_user.get_full_name()} joined canvas {canvas_id}")
 
@@ -25,56 +65,78 @@ def handle_leave_canvas(data):
     if canvas_id:
         room = f"canvas_{canvas_id}"
         leave_room(room)
+        for protocol in PROTOCOLS:
+            leave_room(protocol_room(canvas_id, protocol))
         
-        # Notify others that user left
-        emit('user_left', {
-            'user_id': current_user.id,
-            'user_name': current_user.get_full_name(),
-            'canvas_id': canvas_id
-        }, room=room, include_self=False)
+        # Notify others once the user's last connection has left
+        for departed in presence.leave(canvas_id, request.sid):
+            emit_user_left(*departed)
         
         print(f"User {current_user.get_full_name()} left canvas {canvas_id}")
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    for departed in presence.disconnect(request.sid):
+        emit_user_left(*departed)
+
+@socketio.on('presence_heartbeat')
+def handle_presence_heartbeat(data=None):
+    # Connections that stop sending this are swept after PRESENCE_TIMEOUT and reported as left
+    presence.heartbeat(request.sid)
+
 @socketio.on('canvas_update')
 def handle_canvas_update(data):
+    data = decode_payload(data)
     canvas_id = data.get('canvas_id')
     if canvas_id:
-        room = f"canvas_{canvas_id}"
+        project = get_canvas_project(canvas_id)
+        if project is None or not can_write_project(project, current_user):
+            return
         
         # Add user info to the update
         data['user_id'] = current_user.id
         data['user_name'] = current_user.get_full_name()
         
         # Broadcast to all other users in the room
-        emit('canvas_update', data, room=room, include_self=False)
+        emit_realtime(socketio, 'canvas_update', data, canvas_id, skip_sid=request.sid)
+        
+        # Element edits are written to the operation log in batches; the revision follows as canvas_revision
+        operation = to_operation(data.get('action'), data.get('element_data'))
+        if operation is not None:
+            canvas_log.append(canvas_id, current_user.id, operation)
         
         print(f"Canvas update from {current_user.get_full_name()} in canvas {canvas_id}: {data.get('action')}")
 
+@socketio.on('canvas_sync')
+def handle_canvas_sync(data):
+    canvas_id = data.get('canvas_id')
+    since = data.get('since')
+    if canvas_id and isinstance(since, int):
+        emit_canvas_sync(canvas_id, since)
+
 @socketio.on('cursor_move')
 def handle_cursor_move(data):
-    canvas_id = data.get('canvas_id')
+    data = decode_payload(data)
+    canvas_id = data.pop('canvas_id', None)
     if canvas_id:
-        room = f"canvas_{canvas_id}"
-        
         # Add user info
         data['user_id'] = current_user.id
         data['user_name'] = current_user.get_full_name()
         
-        # Broadcast cursor position to others
-        emit('cursor_update', data, room=room, include_self=False)
+        # Buffered and sent with the next batched cursor_update for the room
+        cursor_aggregator.track(canvas_id, current_user.id, data)
 
 @socketio.on('element_select')
 def handle_element_select(data):
+    data = decode_payload(data)
     canvas_id = data.get('canvas_id')
     if canvas_id:
-        room = f"canvas_{canvas_id}"
-        
         # Add user info
         data['user_id'] = current_user.id
         data['user_name'] = current_user.get_full_name()
         
         # Broadcast selection to others
-        emit('element_selected', data, room=room, include_self=False)
+        emit_realtime(socketio, 'element_selected', data, canvas_id, skip_sid=request.sid)
 
 @socketio.on('chat_message')
 def handle_chat_message(data):
@@ -87,6 +149,19 @@ def handle_chat_message(data):
         data['user_name'] = current_user.get_full_name()
         data['timestamp'] = data.get('timestamp')
         
+        # A message without a timestamp was not posted over HTTP first, so it is stored from here
+        if data['timestamp'] is None:
+            project = get_canvas_project(canvas_id)
+            if project is None or not can_read_project(project, current_user):
+                return
+            try:
+                queued = chat_writer.submit(canvas_id, current_user.id, data['user_name'],
+                                            data.get('message', ''), data.get('message_type', 'text'))
+            except ChatQueueFullError as e:
+                emit('chat_message_rejected', {'canvas_id': canvas_id, 'message': str(e)})
+                return
+            data.update(queued, timestamp=queued['created_at'])
+        
         # Broadcast message to all users in the room
         emit('new_chat_message', data, room=room)
         
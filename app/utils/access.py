@@ -0,0 +1,65 @@
+from collections import namedtuple
+from flask import g
+from app.models.invitation import ProjectMember
+from app.utils.cache import TTLCache
+
+# Immutable snapshot of a ProjectMember row, safe to share between requests
+Membership = namedtuple('Membership', ['role', 'permissions'])
+
+membership_cache = TTLCache(ttl=30)
+
+_MISSING = object()
+
+def get_membership(project_id, user_id):
+    # Memoized for the request in g, then in the process cache keyed by (user_id, project_id)
+    key = (user_id, project_id)
+    memberships = g.setdefault('memberships', {})
+    if key in memberships:
+        return memberships[key]
+    
+    membership = membership_cache.get(key, _MISSING)
+    if membership is _MISSING:
+        member = ProjectMember.query.filter_by(project_id=project_id, user_id=user_id).first()
+        membership = None
+        if member:
+            permissions = tuple(member.permissions.split(',')) if member.permissions else ()
+            membership = Membership(role=member.role, permissions=permissions)
+        membership_cache.set(key, membership)
+    
+    memberships[key] = membership
+    return membership
+
+def invalidate_membership(project_id, user_id):
+    key = (user_id, project_id)
+    membership_cache.pop(key)
+    g.setdefault('memberships', {}).pop(key, None)
+
+def is_project_manager(project, user):
+    return user.is_admin() or project.created_by == user.id
+
+def can_read_project(project, user):
+    if is_project_manager(project, user):
+        return True
+    return get_membership(project.id, user.id) is not None
+
+def can_write_project(project, user):
+    if is_project_manager(project, user):
+        return True
+    membership = get_membership(project.id, user.id)
+    return membership is not None and ('write' in membership.permissions or 'create' in membership.permissions)
+
+def get_project_role(project, user):
+    if user.is_admin():
+        return 'admin'
+    if project.created_by == user.id:
+        return 'owner'
+    membership = get_membership(project.id, user.id)
+    return membership.role if membership else 'member'
+
+def get_project_permissions(project, user):
+    if is_project_manager(project, user):
+        return ['read', 'write', 'create', 'delete']
+    membership = get_membership(project.id, user.id)
+    if membership:
+        return list(membership.permissions) if membership.permissions else ['read', 'write']
+    return ['read']
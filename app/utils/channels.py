@@ -0,0 +1,70 @@
+import json
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.canvas import Canvas
+from app.utils.cache import TTLCache
+
+# Chat channels are canvases with a unique channel_key: 'project:<id>' for a project's canvas,
+# 'global' and 'admin' for the site-wide rooms. Resolved ids are kept in the process cache
+# (CHANNEL_CACHE_TTL), so chat routes go straight to the canvas id without looking the canvas up.
+CHANNEL_SCOPES = ('project', 'global', 'admin')
+
+CHANNEL_TITLES = {
+    'global': 'Global Chat',
+    'admin': 'Admin Chat'
+}
+
+channel_cache = TTLCache(ttl=60, maxsize=20000)
+
+def channel_key(scope, project_id=None):
+    if scope not in CHANNEL_SCOPES:
+        raise ValueError(f'Unknown channel scope: {scope}')
+    return f'project:{project_id}' if scope == 'project' else scope
+
+def legacy_channel(scope, project_id):
+    # Canvases created before channel keys existed, found the way the routes used to find them
+    if scope == 'project':
+        query = Canvas.query.filter_by(project_id=project_id)
+    else:
+        query = Canvas.query.filter_by(title=CHANNEL_TITLES[scope], project_id=None)
+    return query.filter(Canvas.channel_key.is_(None)).order_by(Canvas.id).first()
+
+def create_channel(scope, project_id, user_id, title):
+    key = channel_key(scope, project_id)
+    try:
+        # Savepoint, so losing a race with another first request only undoes this claim
+        with db.session.begin_nested():
+            canvas = legacy_channel(scope, project_id)
+            if canvas:
+                canvas.channel_key = key
+            else:
+                canvas = Canvas(
+                    project_id=project_id,
+                    channel_key=key,
+                    title=title or CHANNEL_TITLES.get(scope, 'Untitled Canvas'),
+                    created_by=user_id,
+                    content=json.dumps({'elements': [], 'settings': {'theme': 'light'}})
+                )
+                db.session.add(canvas)
+        db.session.commit()
+        return canvas.id
+    except IntegrityError:
+        return db.session.query(Canvas.id).filter_by(channel_key=key).scalar()
+
+def resolve_channel(scope, project_id=None, user_id=None, title=None):
+    # Returns the canvas id for the channel, creating it (as user_id, with title) on first use
+    key = channel_key(scope, project_id)
+    canvas_id = channel_cache.get(key)
+    if canvas_id is None:
+        canvas_id = db.session.query(Canvas.id).filter_by(channel_key=key).scalar()
+        if canvas_id is None:
+            canvas_id = create_channel(scope, project_id, user_id, title)
+        channel_cache.set(key, canvas_id)
+    return canvas_id
+
+def release_project_channel(project_id):
+    # Called before a project is deleted, so its canvas can't be resolved for a later project.
+    # Only this worker's cache is cleared; other workers drop the entry within CHANNEL_CACHE_TTL.
+    key = channel_key('project', project_id)
+    Canvas.query.filter_by(channel_key=key).update({'channel_key': None}, synchronize_session=False)
+    channel_cache.pop(key)
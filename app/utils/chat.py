@@ -0,0 +1,59 @@
+from flask import request, jsonify
+from flask_login import current_user
+from app import db, chat_writer
+from app.models.canvas import CanvasChatMessage
+from app.utils.chatwriter import ChatQueueFullError
+
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
+def chat_history_response(canvas_id):
+    # ?before_id= pages back through history, ?after_id= (or ?since=) returns only newer messages
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    if after_id is None:
+        after_id = request.args.get('since', type=int)
+    limit = request.args.get('limit', CHAT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+    
+    messages, has_more = CanvasChatMessage.history(canvas_id, before_id=before_id, after_id=after_id, limit=limit)
+    
+    # ?unconfirmed= lists client_refs of the caller's queued messages still unconfirmed after a while;
+    # each comes back either in saved as [client_ref, id] or in failed_refs when it was never stored
+    unconfirmed = [ref for ref in request.args.get('unconfirmed', '').split(',') if ref][:CHAT_MAX_PAGE_SIZE]
+    saved = {}
+    if unconfirmed:
+        saved = dict(db.session.query(CanvasChatMessage.client_ref, CanvasChatMessage.id).filter(
+            CanvasChatMessage.canvas_id == canvas_id,
+            CanvasChatMessage.user_id == current_user.id,
+            CanvasChatMessage.client_ref.in_(unconfirmed)
+        ).all())
+    
+    return jsonify({
+        'success': True,
+        'messages': [message.to_dict() for message in messages],
+        'saved': [[ref, message_id] for ref, message_id in saved.items()],
+        'failed_refs': [ref for ref in unconfirmed if ref not in saved],
+        'has_more': has_more,
+        'oldest_id': messages[0].id if messages else before_id,
+        'newest_id': messages[-1].id if messages else after_id
+    })
+
+def queue_chat_response(canvas_id):
+    # Acknowledged before the INSERT: the message has no id yet and is matched later by client_ref
+    data = request.get_json(silent=True) or {}
+    try:
+        message = chat_writer.submit(
+            canvas_id,
+            current_user.id,
+            current_user.get_full_name(),
+            data.get('message', ''),
+            data.get('message_type', 'text')
+        )
+    except ChatQueueFullError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'message': message
+    }), 202
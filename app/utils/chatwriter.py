@@ -0,0 +1,147 @@
+import atexit
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+class ChatQueueFullError(Exception):
+    pass
+
+# Write-behind chat ingestion. submit() acknowledges right away with the message as it will be
+# stored (id None, queued True, plus a client_ref); a single background writer drains the queue
+# every tick and group-commits up to batch_size messages at a time. One FIFO queue and one writer
+# keep messages in arrival order, so ids follow that order within every canvas. Once a batch is
+# committed each canvas room gets chat_messages_saved with the [client_ref, id] pairs, and
+# chat_messages_failed with the client_refs of messages that could not be stored.
+class ChatWriter:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.interval = 0.05
+        self.batch_size = 500
+        self.max_pending = 10000
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.interval = float(app.config.get('CHAT_FLUSH_INTERVAL', 0.05))
+        self.batch_size = int(app.config.get('CHAT_BATCH_SIZE', 500))
+        self.max_pending = int(app.config.get('CHAT_QUEUE_SIZE', 10000))
+        # Messages still queued when the process exits are written on the way out
+        atexit.register(self.drain)
+
+    def pending(self):
+        return len(self._queue)
+
+    def submit(self, canvas_id, user_id, user_name, message, message_type='text', file_path=None):
+        queued = {
+            'id': None,
+            'queued': True,
+            'client_ref': uuid.uuid4().hex,
+            'canvas_id': canvas_id,
+            'user_id': user_id,
+            'user_name': user_name,
+            'message': message,
+            'message_type': message_type,
+            'file_path': file_path,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        with self._lock:
+            if len(self._queue) >= self.max_pending:
+                raise ChatQueueFullError('Chat is busy, please resend in a moment')
+            self._queue.append(queued)
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+        return queued
+
+    def _take_batch(self):
+        with self._lock:
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def flush(self):
+        # Writes one batch; returns how many messages it took off the queue
+        with self._flush_lock:
+            batch = self._take_batch()
+            if batch:
+                with self.app.app_context():
+                    saved, dropped = self._write(batch)
+                self._announce(saved, dropped)
+            return len(batch)
+
+    def drain(self):
+        while self._queue:
+            self.flush()
+
+    def _write(self, batch):
+        from app import db
+        from app.models.canvas import CanvasChatMessage
+
+        def to_row(queued):
+            return CanvasChatMessage(
+                canvas_id=queued['canvas_id'],
+                user_id=queued['user_id'],
+                message=queued['message'],
+                message_type=queued['message_type'],
+                file_path=queued['file_path'],
+                client_ref=queued['client_ref'],
+                created_at=datetime.fromisoformat(queued['created_at'])
+            )
+
+        rows = [to_row(queued) for queued in batch]
+        try:
+            db.session.add_all(rows)
+            db.session.commit()
+            return [(queued, row.id) for queued, row in zip(batch, rows)], []
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Chat batch of {len(batch)} failed, writing one by one: {e}")
+
+        # Isolate the message(s) that broke the batch; the rest still go in, in order
+        saved, dropped = [], []
+        for queued in batch:
+            row = to_row(queued)
+            try:
+                db.session.add(row)
+                db.session.commit()
+                saved.append((queued, row.id))
+            except Exception as e:
+                db.session.rollback()
+                dropped.append(queued)
+                print(f"✗ Dropped chat message for canvas {queued['canvas_id']}: {e}")
+        return saved, dropped
+
+    def _announce(self, saved, dropped):
+        by_canvas = {}
+        for queued, message_id in saved:
+            by_canvas.setdefault(queued['canvas_id'], []).append([queued['client_ref'], message_id])
+        for canvas_id, pairs in by_canvas.items():
+            self.socketio.emit('chat_messages_saved', {
+                'canvas_id': canvas_id,
+                'saved': pairs
+            }, room=f'canvas_{canvas_id}')
+
+        # The sender was already answered 202, so a dropped message has to be reported here. Clients
+        # that poll instead find out through the history route, which no longer finds the client_ref.
+        failed = {}
+        for queued in dropped:
+            failed.setdefault(queued['canvas_id'], []).append(queued['client_ref'])
+        for canvas_id, client_refs in failed.items():
+            self.socketio.emit('chat_messages_failed', {
+                'canvas_id': canvas_id,
+                'client_refs': client_refs,
+                'message': 'Message could not be saved, please resend'
+            }, room=f'canvas_{canvas_id}')
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                # Keep going without sleeping while a burst fills whole batches
+                while self.flush() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Chat writer error: {e}")
@@ -0,0 +1,52 @@
+import threading
+import time
+from app.utils.protocol import emit_realtime
+
+# Buffers the latest cursor position per user and canvas room and emits
+# one batched cursor_update frame per room on every tick
+class CursorAggregator:
+    def __init__(self):
+        self.socketio = None
+        self.interval = 1.0 / 20
+        self.stale_after = 1.0
+        self._pending = {}  # canvas_id -> {user_id: (received_at, payload)}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.interval = 1.0 / float(app.config.get('CURSOR_FLUSH_HZ', 20))
+        self.stale_after = float(app.config.get('CURSOR_STALE_SECONDS', 1.0))
+
+    def track(self, canvas_id, user_id, payload):
+        with self._lock:
+            self._pending.setdefault(canvas_id, {})[user_id] = (time.monotonic(), payload)
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def forget(self, canvas_id, user_id):
+        with self._lock:
+            self._pending.get(canvas_id, {}).pop(user_id, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        now = time.monotonic()
+        for canvas_id, cursors in pending.items():
+            # A position that waited longer than stale_after is no longer worth sending
+            fresh = [payload for received_at, payload in cursors.values()
+                     if now - received_at <= self.stale_after]
+            if fresh:
+                emit_realtime(self.socketio, 'cursor_update', {
+                    'canvas_id': canvas_id,
+                    'cursors': fresh
+                }, canvas_id)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Cursor flush error: {e}")
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Longest-side buckets rendered as WebP; the smallest one also gets a JPEG/PNG copy for clients without WebP
+DERIVATIVE_SIZES = (160, 480, 1280)
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'tiff'}
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+def render_derivatives(source_path, sizes=DERIVATIVE_SIZES):
+    # Runs in a worker process; writes <stem>.<size>.webp next to the source and returns what it wrote
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(source_path)[0]
+    variants = []
+    with Image.open(source_path) as image:
+        image.seek(0)  # first frame of animated images
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for size in sizes:
+            # No upscaling: past the original size, one full-size WebP preview is enough
+            if variants and max(image.size) <= variants[-1]['size']:
+                break
+            rendition = image.copy()
+            rendition.thumbnail((size, size), Image.LANCZOS)
+            path = f'{stem}.{size}.webp'
+            rendition.save(path, 'WEBP', quality=80, method=4)
+            variants.append({'size': size, 'format': 'webp', 'width': rendition.width,
+                             'height': rendition.height, 'path': path})
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((sizes[0], sizes[0]), Image.LANCZOS)
+        fallback_format, extension = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+        path = f'{stem}.{sizes[0]}.{extension}'
+        thumbnail.save(path, fallback_format, optimize=True, **({} if has_alpha else {'quality': 82}))
+        variants.append({'size': sizes[0], 'format': extension, 'width': thumbnail.width,
+                         'height': thumbnail.height, 'path': path})
+
+    return variants
+
+def remove_derivatives(variants, upload_folder):
+    for variant in variants or ():
+        path = os.path.join(upload_folder, variant['url'][len('/static/uploads/'):])
+        if os.path.exists(path):
+            os.remove(path)
+
+# Renders image derivatives on a process pool so resizing never blocks a request or the event loop.
+# on_done(variants) runs in an app context once the worker finishes and is committed afterwards.
+class DerivativePipeline:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.workers = 2
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.workers = int(app.config.get('DERIVATIVE_WORKERS', 2))
+
+    def _get_executor(self):
+        # Workers are spawned, not forked: by now the server may be monkey-patched and hold a DB pool
+        # and an event hub, none of which survive a fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def to_variants(self, rendered):
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        return [{
+            'size': variant['size'],
+            'format': variant['format'],
+            'width': variant['width'],
+            'height': variant['height'],
+            'url': '/static/uploads/' + os.path.relpath(variant['path'], upload_folder).replace(os.sep, '/')
+        } for variant in rendered]
+
+    def submit(self, source_path, on_done):
+        if self.workers <= 0:
+            self._finish(source_path, on_done, lambda: render_derivatives(source_path))
+            return
+        future = self._get_executor().submit(render_derivatives, source_path)
+        # Done callbacks run on the pool's management thread; the DB work goes to a background task
+        future.add_done_callback(lambda future: self.socketio.start_background_task(
+            self._finish, source_path, on_done, future.result))
+
+    def _finish(self, source_path, on_done, result):
+        from app import db
+        try:
+            variants = self.to_variants(result())
+        except Exception as e:
+            print(f"✗ Derivatives failed for {source_path}: {e}")
+            variants = []
+
+        with self.app.app_context():
+            try:
+                on_done(variants)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"✗ Could not record derivatives for {source_path}: {e}")
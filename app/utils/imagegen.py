@@ -0,0 +1,188 @@
+import hashlib
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from app.utils.cache import TTLCache
+
+class ImageGenerationError(Exception):
+    pass
+
+class QueueFullError(Exception):
+    pass
+
+# A provider turns a prompt into an image URL; generate() may block and raises ImageGenerationError
+class ImageProvider:
+    name = 'base'
+
+    def generate(self, prompt, width, height, model):
+        raise NotImplementedError
+
+class PollinationsProvider(ImageProvider):
+    name = 'pollinations'
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def generate(self, prompt, width, height, model):
+        encoded_prompt = urllib.parse.quote(prompt)
+        image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?model={model}&width={width}&height={height}"
+        try:
+            response = requests.head(image_url, timeout=self.timeout)
+        except requests.RequestException:
+            raise ImageGenerationError('Unable to connect to image generation service')
+        if response.status_code != 200:
+            raise ImageGenerationError('Image generation service is currently unavailable')
+        return image_url
+
+# Offline provider for development and tests: deterministic URLs, no network. fail and delay
+# simulate an unavailable or slow service; calls counts the provider calls actually made.
+class FakeProvider(ImageProvider):
+    name = 'fake'
+
+    def __init__(self, fail=False, delay=0):
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt, width, height, model):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ImageGenerationError('Fake provider failure')
+        digest = hashlib.sha256(f'{model}:{width}x{height}:{prompt}'.encode('utf-8')).hexdigest()[:16]
+        return f"https://images.invalid/{digest}.png?width={width}&height={height}"
+
+PROVIDERS = {
+    'pollinations': PollinationsProvider,
+    'fake': FakeProvider
+}
+
+# Runs provider calls on a bounded thread pool, caches results by prompt and parameters,
+# and reports each finished job to its canvas room as image_generated / image_generation_failed.
+# Job status lives in the image_generation_jobs table so any worker can answer a poll; requests for
+# the same prompt that arrive while a call is running share it within this worker.
+class ImageGenerationService:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.provider = PollinationsProvider()
+        self.workers = 4
+        self.max_pending = 32
+        self.job_ttl = 3600
+        self.results = TTLCache(ttl=3600)
+        self._inflight = {}  # cache key -> job ids waiting on the same provider call
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.provider = PROVIDERS[app.config.get('IMAGE_PROVIDER', 'pollinations')]()
+        self.workers = int(app.config.get('IMAGE_GENERATION_WORKERS', 4))
+        self.max_pending = int(app.config.get('IMAGE_GENERATION_MAX_PENDING', 32))
+        self.job_ttl = float(app.config.get('IMAGE_JOB_TTL', 3600))
+        self.results.ttl = float(app.config.get('IMAGE_CACHE_TTL', 3600))
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='imagegen')
+        return self._executor
+
+    def get_job(self, job_id):
+        from app import db
+        from app.models.canvas import ImageGenerationJob
+
+        job = db.session.get(ImageGenerationJob, job_id)
+        return job.to_dict() if job else None
+
+    def submit(self, canvas_id, user_id, user_name, prompt, width, height, model):
+        # Returns the job dict; a cached prompt comes back already completed
+        from app import db
+        from app.models.canvas import ImageGenerationJob
+
+        ImageGenerationJob.query.filter(
+            ImageGenerationJob.created_at < datetime.utcnow() - timedelta(seconds=self.job_ttl)
+        ).delete(synchronize_session=False)
+
+        key = (self.provider.name, model, width, height, prompt)
+        job = ImageGenerationJob(
+            job_id=uuid.uuid4().hex,
+            canvas_id=canvas_id,
+            user_id=user_id,
+            status='pending',
+            prompt=prompt,
+            width=width,
+            height=height,
+            model=model,
+            generated_by=user_name,
+            cached=False
+        )
+
+        cached = self.results.get(key)
+        if cached is not None:
+            job.status = 'completed'
+            job.cached = True
+            job.image_url = cached['image_url']
+            job.generated_at = cached['generated_at']
+
+        # Committed before the job can be handed to a pool thread, which looks it up when the call finishes
+        db.session.add(job)
+        db.session.commit()
+        if cached is not None:
+            return job.to_dict()
+
+        with self._lock:
+            waiting = self._inflight.get(key)
+            started = waiting is None and len(self._inflight) < self.max_pending
+            if started:
+                self._inflight[key] = waiting = []
+            if waiting is not None:
+                waiting.append(job.job_id)
+
+        if waiting is None:
+            db.session.delete(job)
+            db.session.commit()
+            raise QueueFullError('Too many image generations in progress, try again shortly')
+        if started:
+            self._get_executor().submit(self._run, key)
+        return job.to_dict()
+
+    def _run(self, key):
+        from app import db
+        from app.models.canvas import ImageGenerationJob
+
+        _, model, width, height, prompt = key
+        try:
+            result = {
+                'image_url': self.provider.generate(prompt, width, height, model),
+                'generated_at': datetime.utcnow()
+            }
+            self.results.set(key, result)
+            update = dict(result, status='completed')
+        except Exception as e:
+            update = {'status': 'failed', 'message': str(e)}
+
+        with self._lock:
+            job_ids = self._inflight.pop(key, [])
+
+        with self.app.app_context():
+            try:
+                jobs = ImageGenerationJob.query.filter(ImageGenerationJob.job_id.in_(job_ids)).all()
+                for job in jobs:
+                    for field, value in update.items():
+                        setattr(job, field, value)
+                finished = [job.to_dict() for job in jobs]
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"✗ Could not record image generation result: {e}")
+                return
+
+        for job in finished:
+            event = 'image_generated' if job['status'] == 'completed' else 'image_generation_failed'
+            self.socketio.emit(event, job, room=f"canvas_{job['canvas_id']}")
@@ -0,0 +1,203 @@
+import threading
+from collections import namedtuple
+from datetime import datetime
+from app.utils.cache import TTLCache
+
+# Realtime canvas_update actions and the log operation each one becomes
+REALTIME_OPERATIONS = {
+    'element_added': 'add',
+    'element_updated': 'update',
+    'element_moved': 'move',
+    'element_deleted': 'delete'
+}
+
+# Just enough of a project for the access checks, cached per canvas so realtime events skip the lookup
+ProjectRef = namedtuple('ProjectRef', ['id', 'created_by'])
+
+canvas_project_cache = TTLCache(ttl=300)
+
+def get_canvas_project(canvas_id):
+    from app import db
+    from app.models.canvas import Canvas
+    from app.models.project import Project
+
+    project = canvas_project_cache.get(canvas_id)
+    if project is None:
+        row = db.session.query(Project.id, Project.created_by)\
+                        .join(Canvas, Canvas.project_id == Project.id)\
+                        .filter(Canvas.id == canvas_id).first()
+        if row is None:
+            return None
+        project = ProjectRef(id=row.id, created_by=row.created_by)
+        canvas_project_cache.set(canvas_id, project)
+    return project
+
+def to_operation(action, element_data):
+    # Returns None for actions and payloads that don't describe an element change
+    op = REALTIME_OPERATIONS.get(action)
+    if op is None or not isinstance(element_data, dict) or element_data.get('id') is None:
+        return None
+    if op == 'add':
+        return {'op': 'add', 'element': element_data}
+    if op == 'move':
+        return dict({key: element_data[key] for key in ('x', 'y') if key in element_data},
+                    op='move', id=element_data['id'])
+    if op == 'delete':
+        return {'op': 'delete', 'id': element_data['id']}
+    return {'op': 'update', 'id': element_data['id'],
+            'fields': {key: value for key, value in element_data.items() if key != 'id'}}
+
+def compact_canvas_log(canvas, retention):
+    # Folds the operations logged since snapshot_revision into Canvas.content, then drops the log rows
+    # older than the retention window, which no reconnecting client is expected to need any more
+    from app.models.canvas import CanvasOperation
+
+    pending = canvas.pending_operations()
+    if pending:
+        canvas.apply_operations(pending, strict=False)
+    canvas.snapshot_revision = canvas.revision
+
+    return CanvasOperation.query.filter(CanvasOperation.canvas_id == canvas.id,
+                                        CanvasOperation.revision <= canvas.revision - retention)\
+                                .delete(synchronize_session=False)
+
+def record_canvas_revision(canvas, user_id, operations, snapshot=False):
+    # Operations are appended to the log; content is only written by a full save (snapshot=True, which
+    # stores the new content itself and logs the operations that lead to it) or by compaction.
+    # The unique (canvas_id, revision) constraint makes a concurrent writer fail.
+    from flask import current_app
+    from app import db
+    from app.models.canvas import CanvasOperation
+
+    canvas.revision = (canvas.revision or 0) + 1
+    canvas.last_saved = datetime.utcnow()
+    canvas.updated_at = datetime.utcnow()
+    if snapshot:
+        canvas.snapshot_revision = canvas.revision
+
+    operation = CanvasOperation(
+        canvas_id=canvas.id,
+        revision=canvas.revision,
+        created_by=user_id
+    )
+    operation.set_operations_json(operations)
+    db.session.add(operation)
+
+    # Compacted once every retention window of revisions, however they were written, so the log stays
+    # under two windows of rows and the content rewrite is spread over many writes
+    retention = current_app.config.get('CANVAS_LOG_RETENTION', 500)
+    if retention > 0 and canvas.revision % retention == 0:
+        compact_canvas_log(canvas, retention)
+
+def canvas_events_since(canvas, since):
+    # The operations after revision `since`, or resync=True when the client has to reload the canvas
+    from app.models.canvas import CanvasOperation
+
+    missed = []
+    resync = since > canvas.revision
+    if not resync:
+        # Rows before the retention window are gone; a gap means the client is too far behind.
+        # Full saves logged before saves were diffed carry no operations and can't be replayed.
+        missed = canvas.operations.filter(CanvasOperation.revision > since)\
+                                  .order_by(CanvasOperation.revision.asc()).all()
+        resync = (
+            len(missed) != canvas.revision - since or
+            any(operation.is_full_save() for operation in missed)
+        )
+
+    return {
+        'canvas_id': canvas.id,
+        'revision': canvas.revision,
+        'resync': resync,
+        'operations': [] if resync else [operation.to_dict() for operation in missed]
+    }
+
+# Persists realtime element edits to the canvas operation log. Edits are broadcast immediately by the
+# socket handler and buffered here; every tick each canvas's buffer becomes one revision per run of
+# edits by the same user (consecutive moves of an element collapse into the last one), then the new
+# revision goes out to the room as canvas_revision so clients know which sequence number they hold.
+class CanvasEventLog:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.interval = 0.25
+        self.max_retries = 3
+        self._pending = {}  # canvas_id -> [(user_id, operation)]
+        self._lock = threading.Lock()
+        self._task = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.interval = float(app.config.get('CANVAS_LOG_FLUSH_INTERVAL', 0.25))
+
+    def append(self, canvas_id, user_id, operation):
+        with self._lock:
+            pending = self._pending.setdefault(canvas_id, [])
+            last = pending[-1] if pending else None
+            if (last and last[0] == user_id and operation['op'] == 'move' and
+                    last[1]['op'] == 'move' and last[1]['id'] == operation['id']):
+                pending[-1] = (user_id, operation)
+            else:
+                pending.append((user_id, operation))
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for canvas_id, operations in pending.items():
+            runs = []
+            for user_id, operation in operations:
+                if runs and runs[-1][0] == user_id:
+                    runs[-1][1].append(operation)
+                else:
+                    runs.append((user_id, [operation]))
+
+            with self.app.app_context():
+                revision = self._write(canvas_id, runs)
+            if revision is not None:
+                self.socketio.emit('canvas_revision', {
+                    'canvas_id': canvas_id,
+                    'revision': revision
+                }, room=f'canvas_{canvas_id}')
+
+    def _write(self, canvas_id, runs):
+        # Appends one log row per run; the content column isn't loaded unless compaction is due
+        from sqlalchemy.exc import IntegrityError
+        from sqlalchemy.orm import defer
+        from app import db
+        from app.models.canvas import Canvas
+
+        for attempt in range(self.max_retries):
+            try:
+                canvas = Canvas.query.options(defer(Canvas.content)).filter_by(id=canvas_id).first()
+                if canvas is None:
+                    return None
+
+                for user_id, operations in runs:
+                    record_canvas_revision(canvas, user_id, operations)
+                # Read before commit, which expires the canvas and would reload it in full
+                revision = canvas.revision
+
+                db.session.commit()
+                return revision
+            except IntegrityError:
+                # A save or patch claimed the revision first; re-read the canvas and append after it
+                db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                print(f"✗ Could not log canvas {canvas_id} operations: {e}")
+                return None
+
+        print(f"✗ Gave up logging canvas {canvas_id} operations after {self.max_retries} conflicts")
+        return None
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Canvas log flush error: {e}")
@@ -0,0 +1,229 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from app.utils.cache import TTLCache
+
+# Presence stores hold one entry per (sid, canvas_id). All methods return plain tuples so the
+# registry can work the same way against process memory or the shared canvas_presence table.
+
+# Single worker: rooms live in this process only
+class MemoryPresenceStore:
+    def __init__(self):
+        self._rooms = {}  # canvas_id -> {sid: [user_id, user_name, last_seen, protocol]}
+        self._sids = {}  # sid -> {canvas_id}
+        self._lock = threading.Lock()
+
+    def add(self, sid, canvas_id, user_id, user_name, protocol):
+        with self._lock:
+            self._rooms.setdefault(canvas_id, {})[sid] = [user_id, user_name, time.time(), protocol]
+            self._sids.setdefault(sid, set()).add(canvas_id)
+
+    def remove(self, sid, canvas_id):
+        with self._lock:
+            return self._remove(sid, canvas_id)
+
+    def _remove(self, sid, canvas_id):
+        entry = self._rooms.get(canvas_id, {}).pop(sid, None)
+        if not self._rooms.get(canvas_id, True):
+            del self._rooms[canvas_id]
+        canvases = self._sids.get(sid)
+        if canvases is not None:
+            canvases.discard(canvas_id)
+            if not canvases:
+                del self._sids[sid]
+        return (canvas_id, entry[0], entry[1]) if entry else None
+
+    def remove_sid(self, sid):
+        with self._lock:
+            return [self._remove(sid, canvas_id) for canvas_id in list(self._sids.get(sid, ()))]
+
+    def touch(self, sid):
+        now = time.time()
+        with self._lock:
+            for canvas_id in self._sids.get(sid, ()):
+                self._rooms[canvas_id][sid][2] = now
+
+    def expire(self, timeout):
+        cutoff = time.time() - timeout
+        with self._lock:
+            stale = [(sid, canvas_id) for canvas_id, sids in self._rooms.items()
+                     for sid, entry in sids.items() if entry[2] < cutoff]
+            return [self._remove(sid, canvas_id) for sid, canvas_id in stale]
+
+    def has_user(self, canvas_id, user_id):
+        with self._lock:
+            return any(entry[0] == user_id for entry in self._rooms.get(canvas_id, {}).values())
+
+    def has_protocol(self, canvas_id, protocol):
+        with self._lock:
+            return any(entry[3] == protocol for entry in self._rooms.get(canvas_id, {}).values())
+
+    def members(self, canvas_id):
+        with self._lock:
+            return list({entry[0]: (entry[0], entry[1]) for entry in self._rooms.get(canvas_id, {}).values()}.values())
+
+# Several workers: every worker reads and writes the canvas_presence table
+class DatabasePresenceStore:
+    def add(self, sid, canvas_id, user_id, user_name, protocol):
+        from app import db
+        from app.models.canvas import CanvasPresence
+        presence = db.session.get(CanvasPresence, (sid, canvas_id))
+        if presence is None:
+            presence = CanvasPresence(sid=sid, canvas_id=canvas_id)
+            db.session.add(presence)
+        presence.user_id = user_id
+        presence.user_name = user_name
+        presence.protocol = protocol
+        presence.last_seen = datetime.utcnow()
+        db.session.commit()
+
+    def _delete(self, *criteria):
+        # One DELETE ... RETURNING: every worker sweeps the same table, and only the one whose
+        # statement removed a row gets it back, so each departure is reported once
+        from app import db
+        from app.models.canvas import CanvasPresence
+        rows = db.session.execute(
+            db.delete(CanvasPresence).where(*criteria)
+              .returning(CanvasPresence.canvas_id, CanvasPresence.user_id, CanvasPresence.user_name)
+        ).all()
+        db.session.commit()
+        return [tuple(row) for row in rows]
+
+    def remove(self, sid, canvas_id):
+        from app.models.canvas import CanvasPresence
+        removed = self._delete(CanvasPresence.sid == sid, CanvasPresence.canvas_id == canvas_id)
+        return removed[0] if removed else None
+
+    def remove_sid(self, sid):
+        from app.models.canvas import CanvasPresence
+        return self._delete(CanvasPresence.sid == sid)
+
+    def touch(self, sid):
+        from app import db
+        from app.models.canvas import CanvasPresence
+        CanvasPresence.query.filter_by(sid=sid).update({'last_seen': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    def expire(self, timeout):
+        from app.models.canvas import CanvasPresence
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        return self._delete(CanvasPresence.last_seen < cutoff)
+
+    def has_user(self, canvas_id, user_id):
+        from app import db
+        from app.models.canvas import CanvasPresence
+        return db.session.query(
+            CanvasPresence.query.filter_by(canvas_id=canvas_id, user_id=user_id).exists()
+        ).scalar()
+
+    def has_protocol(self, canvas_id, protocol):
+        from app import db
+        from app.models.canvas import CanvasPresence
+        return db.session.query(
+            CanvasPresence.query.filter_by(canvas_id=canvas_id, protocol=protocol).exists()
+        ).scalar()
+
+    def members(self, canvas_id):
+        from app import db
+        from app.models.canvas import CanvasPresence
+        rows = db.session.query(CanvasPresence.user_id, db.func.max(CanvasPresence.user_name))\
+                         .filter(CanvasPresence.canvas_id == canvas_id)\
+                         .group_by(CanvasPresence.user_id).all()
+        return [(user_id, user_name) for user_id, user_name in rows]
+
+PRESENCE_STORES = {
+    'memory': MemoryPresenceStore,
+    'database': DatabasePresenceStore
+}
+
+# Server-side record of who is in each canvas room. A user counts as present while any of their
+# connections (tabs) is in the room, so user_joined / user_left fire on the first join and last leave.
+# Connections that stop sending presence_heartbeat are swept after the timeout and reported as left.
+class PresenceRegistry:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.store = MemoryPresenceStore()
+        self.timeout = 75.0
+        self.sweep_interval = 15.0
+        self._task = None
+        self._lock = threading.Lock()
+        # Shared stores are asked at most once a second per canvas whether an encoding has listeners
+        self._protocol_cache = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        backend = app.config.get('PRESENCE_BACKEND', 'memory')
+        self.store = PRESENCE_STORES[backend]()
+        self._protocol_cache = TTLCache(ttl=1.0) if backend == 'database' else None
+        self.timeout = float(app.config.get('PRESENCE_TIMEOUT', 75))
+        self.sweep_interval = float(app.config.get('PRESENCE_SWEEP_INTERVAL', 15))
+
+    def _ensure_sweeper(self):
+        with self._lock:
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def snapshot(self, canvas_id):
+        return {
+            'canvas_id': canvas_id,
+            'users': [{'user_id': user_id, 'user_name': user_name}
+                      for user_id, user_name in self.store.members(canvas_id)]
+        }
+
+    def join(self, canvas_id, sid, user_id, user_name, protocol='json'):
+        # Returns True when this is the user's first connection in the room
+        self._ensure_sweeper()
+        arrived = not self.store.has_user(canvas_id, user_id)
+        self.store.add(sid, canvas_id, user_id, user_name, protocol)
+        if self._protocol_cache is not None:
+            self._protocol_cache.pop((canvas_id, protocol))
+        return arrived
+
+    def has_protocol(self, canvas_id, protocol):
+        # Whether any connection in the room chose this encoding; callable outside a request
+        if self._protocol_cache is None:
+            return self.store.has_protocol(canvas_id, protocol)
+        listening = self._protocol_cache.get((canvas_id, protocol))
+        if listening is None:
+            with self.app.app_context():
+                listening = self.store.has_protocol(canvas_id, protocol)
+            self._protocol_cache.set((canvas_id, protocol), listening)
+        return listening
+
+    def leave(self, canvas_id, sid):
+        # Both return the (canvas_id, user_id, user_name) rooms the user has no connection left in
+        removed = self.store.remove(sid, canvas_id)
+        return self._departed([removed] if removed else [])
+
+    def disconnect(self, sid):
+        return self._departed(self.store.remove_sid(sid))
+
+    def heartbeat(self, sid):
+        self.store.touch(sid)
+
+    def _departed(self, removed):
+        # Of the removed (canvas_id, user_id, user_name) entries, those whose user has no connection left
+        departed = []
+        for canvas_id, user_id, user_name in removed:
+            if (canvas_id, user_id, user_name) not in departed and not self.store.has_user(canvas_id, user_id):
+                departed.append((canvas_id, user_id, user_name))
+        return departed
+
+    def sweep(self):
+        for canvas_id, user_id, user_name in self._departed(self.store.expire(self.timeout)):
+            self.socketio.emit('user_left', {
+                'user_id': user_id,
+                'user_name': user_name,
+                'canvas_id': canvas_id
+            }, room=f'canvas_{canvas_id}')
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.sweep_interval)
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(f"Presence sweep error: {e}")
@@ -0,0 +1,59 @@
+from flask import g
+from flask_login import UserMixin
+from app import db
+from app.models.user import User
+from app.utils.cache import TTLCache
+
+principal_cache = TTLCache(ttl=60)
+
+PRINCIPAL_FIELDS = ('id', 'username', 'first_name', 'last_name', 'role', 'is_active', 'profile_picture')
+
+# Immutable snapshot of the logged-in user, shared between requests and Socket.IO events.
+# Anything outside PRINCIPAL_FIELDS is read from the full User row, loaded once per request.
+class SessionPrincipal(UserMixin):
+    __slots__ = PRINCIPAL_FIELDS
+
+    def __init__(self, user):
+        for field in PRINCIPAL_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"SessionPrincipal is read-only, update current_user.get_record().{name} instead")
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get_record(), name)
+
+    def get_record(self):
+        records = g.setdefault('user_records', {})
+        user = records.get(self.id)
+        if user is None:
+            user = db.session.get(User, self.id)
+            records[self.id] = user
+        return user
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def get_full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return f'<SessionPrincipal {self.username}>'
+
+def load_principal(user_id):
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        principal = SessionPrincipal(user)
+        principal_cache.set(user_id, principal)
+        # The row is already in this request's session, so the record fallback is free
+        g.setdefault('user_records', {})[user_id] = user
+    return principal
+
+def invalidate_principal(user_id):
+    principal_cache.pop(user_id)
+    g.setdefault('user_records', {}).pop(user_id, None)
@@ -0,0 +1,93 @@
+import msgpack
+
+# Compact realtime protocol, negotiated per connection with join_canvas {'protocol': 'compact'}.
+# JSON clients sit in canvas_<id>:json and compact clients in canvas_<id>:compact, next to the
+# shared canvas_<id> room that every other event still goes to. The high-frequency events below
+# reach compact clients as MessagePack binary frames under a one-letter event name, with short
+# field codes and without user_name: clients resolve user_id from the presence snapshot.
+PROTOCOLS = ('json', 'compact')
+
+COMPACT_EVENTS = {
+    'canvas_update': 'u',
+    'cursor_update': 'c',
+    'element_selected': 's'
+}
+
+# Only top-level keys (and each cursor in cursor_update) are coded; element data is passed through as-is
+FIELD_CODES = {
+    'canvas_id': 'c',
+    'user_id': 'u',
+    'action': 'a',
+    'element_data': 'd',
+    'element_id': 'e',
+    'update': 'p',
+    'cursors': 'k',
+    'timestamp': 't',
+    'x': 'x',
+    'y': 'y'
+}
+FIELD_NAMES = {code: field for field, code in FIELD_CODES.items()}
+
+ACTION_CODES = {
+    'element_added': 1,
+    'element_updated': 2,
+    'element_moved': 3,
+    'element_deleted': 4
+}
+ACTION_NAMES = {code: action for action, code in ACTION_CODES.items()}
+
+# Enrichment fields the compact encoding drops
+OMITTED_FIELDS = ('user_name',)
+
+def protocol_description():
+    # Sent once to a compact client so it can decode frames without hard-coding the tables
+    return {
+        'protocol': 'compact',
+        'events': COMPACT_EVENTS,
+        'fields': FIELD_CODES,
+        'actions': ACTION_CODES
+    }
+
+def compact_fields(payload):
+    compact = {}
+    for key, value in payload.items():
+        if key in OMITTED_FIELDS:
+            continue
+        if key == 'action':
+            value = ACTION_CODES.get(value, value)
+        elif key == 'cursors':
+            value = [compact_fields(cursor) for cursor in value]
+        compact[FIELD_CODES.get(key, key)] = value
+    return compact
+
+def expand_fields(compact):
+    payload = {}
+    for key, value in compact.items():
+        field = FIELD_NAMES.get(key, key)
+        if field == 'action':
+            value = ACTION_NAMES.get(value, value)
+        elif field == 'cursors':
+            value = [expand_fields(cursor) for cursor in value]
+        payload[field] = value
+    return payload
+
+def encode_compact(payload):
+    return msgpack.packb(compact_fields(payload), use_bin_type=True)
+
+def decode_payload(data):
+    # Incoming events may come from either kind of client; binary frames are compact MessagePack
+    if isinstance(data, (bytes, bytearray)):
+        return expand_fields(msgpack.unpackb(bytes(data), raw=False))
+    return data or {}
+
+def protocol_room(canvas_id, protocol):
+    return f'canvas_{canvas_id}:{protocol}'
+
+def emit_realtime(socketio, event, payload, canvas_id, skip_sid=None):
+    # Fans one high-frequency event out to both encodings of the canvas room. The compact copy is
+    # only encoded and published while presence has a compact client in the room.
+    from app import presence
+    socketio.emit(event, payload, room=protocol_room(canvas_id, 'json'), skip_sid=skip_sid)
+    if presence.has_protocol(canvas_id, 'compact'):
+        socketio.emit(COMPACT_EVENTS[event], encode_compact(payload),
+                      room=protocol_room(canvas_id, 'compact'), skip_sid=skip_sid)
@@ -0,0 +1,102 @@
+import base64
+import pickle
+import select
+import time
+import uuid
+import zlib
+import psycopg2
+from psycopg2 import sql
+from socketio import PubSubManager
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Socket.IO client manager that shares emits between worker processes through
+# PostgreSQL LISTEN/NOTIFY, so no Redis or RabbitMQ is needed next to the database
+class PostgresManager(PubSubManager):
+    name = 'postgresql'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        self.url = url
+        self._publish_conn = None
+        self._fragments = {}  # message id -> {index: chunk}
+        super(PostgresManager, self).__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        conn = psycopg2.connect(self.url)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _encode(self, data):
+        payload = base64.b64encode(zlib.compress(pickle.dumps(data))).decode('ascii')
+        if len(payload) + 1 <= MAX_NOTIFY_PAYLOAD:
+            return ['=' + payload]
+
+        # Oversized messages are split into "message_id:index:total:chunk" fragments
+        message_id = uuid.uuid4().hex[:12]
+        size = MAX_NOTIFY_PAYLOAD - 64
+        chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+        return [f'{message_id}:{index}:{len(chunks)}:{chunk}' for index, chunk in enumerate(chunks)]
+
+    def _decode(self, payload):
+        if payload.startswith('='):
+            return base64.b64decode(payload[1:])
+
+        message_id, index, total, chunk = payload.split(':', 3)
+        fragments = self._fragments.setdefault(message_id, {})
+        fragments[int(index)] = chunk
+        if len(fragments) < int(total):
+            return None
+        del self._fragments[message_id]
+        return base64.b64decode(''.join(fragments[i] for i in range(int(total))))
+
+    def _publish(self, data):
+        for attempt in range(2):
+            try:
+                if self._publish_conn is None or self._publish_conn.closed:
+                    self._publish_conn = self._connect()
+                with self._publish_conn.cursor() as cursor:
+                    # A single NOTIFY per fragment keeps fragments of one message in order
+                    for payload in self._encode(data):
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                return
+            except psycopg2.Error as e:
+                self._publish_conn = None
+                self._get_logger().error(f'Cannot publish to PostgreSQL ({e}), '
+                                         f'{"retrying" if attempt == 0 else "giving up"}')
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                retry_sleep = 1
+
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        message = self._decode(notify.payload)
+                        if message is not None:
+                            yield zlib.decompress(message)
+            except psycopg2.Error as e:
+                self._get_logger().error(f'Cannot receive from PostgreSQL ({e}), '
+                                         f'retrying in {retry_sleep} secs')
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+def create_client_manager(message_queue, database_url, channel):
+    # "postgresql" reuses the application database, any other postgres URL is used as is
+    if message_queue == 'postgresql':
+        # LISTEN/NOTIFY needs PostgreSQL; fail at startup instead of inside the listener thread
+        if not database_url.startswith(('postgresql://', 'postgres://')):
+            raise ValueError('SOCKETIO_MESSAGE_QUEUE=postgresql requires DATABASE_URL to point at '
+                             f"PostgreSQL, got {database_url.split(':')[0]}")
+        return PostgresManager(database_url, channel=channel)
+    if message_queue.startswith(('postgresql://', 'postgres://')):
+        return PostgresManager(message_queue, channel=channel)
+    return None
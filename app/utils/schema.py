@@ -0,0 +1,109 @@
+from sqlalchemy import BigInteger, inspect, text
+from sqlalchemy.schema import CreateTable
+from app import db
+
+# db.create_all() only creates missing tables. Columns added to existing tables, and columns that
+# became nullable, are brought in line here so an existing database keeps working after an update.
+# Runs on every start right after create_all; every step is skipped once the schema matches.
+
+def column_default_sql(column):
+    # Only scalar defaults can be written into the DDL; NOT NULL columns need one to add to filled tables
+    default = column.default.arg if column.default is not None and not callable(column.default.arg) else None
+    if default is None:
+        return ''
+    if isinstance(default, bool):
+        return f' DEFAULT {int(default)}'
+    if isinstance(default, str):
+        return " DEFAULT '" + default.replace("'", "''") + "'"
+    return f' DEFAULT {default}'
+
+def add_column_sql(table, column, dialect):
+    # IF NOT EXISTS lets several PostgreSQL workers start at once
+    exists = ' IF NOT EXISTS' if dialect.name == 'postgresql' else ''
+    sql = f'ALTER TABLE {table.name} ADD COLUMN{exists} {column.name} {column.type.compile(dialect=dialect)}'
+    # Nullable columns are added without their Python default, so existing rows read NULL
+    # (e.g. canvas element bounds, which are then measured on first use)
+    if not column.nullable:
+        sql += column_default_sql(column) + ' NOT NULL'
+    for foreign_key in column.foreign_keys:
+        sql += f' REFERENCES {foreign_key.column.table.name}({foreign_key.column.name})'
+    return sql
+
+def rebuild_sqlite_table(connection, table, existing_columns):
+    # SQLite can't drop NOT NULL in place: copy the rows into a table created from the model
+    metadata = db.MetaData()
+    for foreign_key in table.foreign_keys:
+        foreign_key.column.table.to_metadata(metadata)  # only so the copy's foreign keys resolve
+    temporary = table.to_metadata(metadata, name=f'{table.name}_upgrade')
+    # Just the table: its indexes keep the old names until the original is dropped, then get recreated
+    connection.execute(CreateTable(temporary))
+    columns = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+    connection.execute(text(f'INSERT INTO {temporary.name} ({columns}) SELECT {columns} FROM {table.name}'))
+    connection.execute(text(f'DROP TABLE {table.name}'))
+    connection.execute(text(f'ALTER TABLE {temporary.name} RENAME TO {table.name}'))
+
+def upgrade_schema(engine):
+    # Returns a description of every change made
+    changes = []
+    dialect = engine.dialect
+
+    with engine.connect() as connection:
+        if dialect.name == 'sqlite':
+            # Dropping a table during a rebuild must not cascade into the rows that reference it;
+            # the pragma only takes effect outside a transaction
+            foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+
+        with connection.begin():
+            inspector = inspect(connection)
+            for table in db.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name']: column for column in inspector.get_columns(table.name)}
+
+                for column in table.columns:
+                    if column.name not in existing:
+                        connection.execute(text(add_column_sql(table, column, dialect)))
+                        changes.append(f'added {table.name}.{column.name}')
+                    elif dialect.name == 'postgresql' and isinstance(column.type, BigInteger) \
+                            and not isinstance(existing[column.name]['type'], BigInteger):
+                        connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT'))
+                        changes.append(f'widened {table.name}.{column.name} to BIGINT')
+
+                relaxed = [column.name for column in table.columns
+                           if column.nullable and not column.primary_key
+                           and column.name in existing and not existing[column.name]['nullable']]
+                if relaxed and dialect.name == 'sqlite':
+                    # Re-read, so the columns just added are copied over too
+                    rebuild_sqlite_table(connection, table, {column['name'] for column in
+                                                             inspect(connection).get_columns(table.name)})
+                    changes.append(f'rebuilt {table.name} to allow NULL in {", ".join(relaxed)}')
+                else:
+                    for name in relaxed:
+                        connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {name} DROP NOT NULL'))
+                        changes.append(f'allowed NULL in {table.name}.{name}')
+
+                # SQLite can't add a UNIQUE column, so unique columns are backed by an index instead
+                unique_indexes = {tuple(index['column_names']) for index in inspect(connection).get_indexes(table.name)
+                                  if index['unique']}
+                unique_indexes |= {tuple(constraint['column_names'])
+                                   for constraint in inspect(connection).get_unique_constraints(table.name)}
+                for column in table.columns:
+                    if column.unique and (column.name,) not in unique_indexes:
+                        connection.execute(text(
+                            f'CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.name}_{column.name} ON {table.name} ({column.name})'
+                        ))
+                        changes.append(f'added unique index on {table.name}.{column.name}')
+
+                index_names = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in index_names:
+                        index.create(connection, checkfirst=True)
+                        changes.append(f'added index {index.name}')
+
+        if dialect.name == 'sqlite':
+            connection.exec_driver_sql(f'PRAGMA foreign_keys={int(foreign_keys)}')
+            connection.commit()
+
+    return changes
@@ -0,0 +1,189 @@
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models.user import User
+from app.models.project import Project
+from app.models.task import Task
+from app.models.canvas import CanvasChatMessage
+
+# Searchable entities: index table, model and the columns folded into its search text
+SEARCH_ENTITIES = {
+    'project': ('search_projects', Project, ('title', 'description')),
+    'task': ('search_tasks', Task, ('title', 'description')),
+    'user': ('search_users', User, ('username', 'email', 'first_name', 'last_name')),
+    'chat': ('search_chat_messages', CanvasChatMessage, ('message',))
+}
+
+MODEL_ENTITIES = {model: entity for entity, (_, model, _) in SEARCH_ENTITIES.items()}
+
+# Index flavour per database URL: 'postgresql' (tsvector + pg_trgm), or on SQLite 'trigram'
+# (FTS5 substring matching), 'fts5' (FTS5 word prefixes) or 'like' (plain table, no FTS5).
+# Read from the index tables on first use, so processes that never ran init_search still agree.
+search_modes = {}
+
+def search_text(obj, columns):
+    return ' '.join(str(value) for value in (getattr(obj, column) for column in columns) if value)
+
+def create_search_tables(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table, _, _ in SEARCH_ENTITIES.values():
+            connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    document TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED
+                )
+            """))
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_document ON {table} USING GIN (document)"))
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_body_trgm ON {table} USING GIN (body gin_trgm_ops)"))
+        return 'postgresql'
+
+    # Entity ids are stored as the rowid, so updates and deletes are primary key lookups
+    for mode, ddl in (
+        ('trigram', "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(body, tokenize='trigram')"),
+        ('fts5', "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(body)"),
+        ('like', "CREATE TABLE IF NOT EXISTS {table} (body TEXT NOT NULL)")
+    ):
+        try:
+            with connection.begin_nested():
+                for table, _, _ in SEARCH_ENTITIES.values():
+                    connection.execute(text(ddl.format(table=table)))
+            return mode
+        except OperationalError:
+            continue
+
+def detect_search_mode(connection):
+    # None while the index tables don't exist yet
+    if connection.dialect.name == 'postgresql':
+        return 'postgresql'
+    row = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"),
+                             {'name': SEARCH_ENTITIES['project'][0]}).first()
+    if row is None:
+        return None
+    ddl = row[0].lower()
+    if 'fts5' not in ddl:
+        return 'like'
+    return 'trigram' if 'trigram' in ddl else 'fts5'
+
+def get_search_mode(connection=None):
+    engine = connection.engine if connection is not None else db.engine
+    key = str(engine.url)
+    mode = search_modes.get(key)
+    if mode is None:
+        if connection is not None:
+            mode = detect_search_mode(connection)
+        else:
+            with engine.connect() as connection:
+                mode = detect_search_mode(connection)
+        if mode is not None:
+            search_modes[key] = mode
+    return mode
+
+def init_search():
+    with db.engine.begin() as connection:
+        existed = inspect(connection).has_table(SEARCH_ENTITIES['project'][0])
+        create_search_tables(connection)
+        # Tables created by an earlier start keep their flavour, whatever this SQLite build supports
+        mode = search_modes[str(db.engine.url)] = detect_search_mode(connection)
+        # First start against an existing database: index what is already there
+        if not existed:
+            rebuild_search_index(connection)
+    print(f"✓ Search index ready ({mode})")
+
+def index_key(connection):
+    # Entity ids are the primary key on PostgreSQL and the rowid on SQLite
+    return 'id' if connection.dialect.name == 'postgresql' else 'rowid'
+
+def index_rows(connection, entity, rows):
+    # rows: [(id, body or None)]; None only removes the entry
+    table = SEARCH_ENTITIES[entity][0]
+    key = index_key(connection)
+    ids = [{'id': entity_id} for entity_id, _ in rows]
+    if ids:
+        connection.execute(text(f"DELETE FROM {table} WHERE {key} = :id"), ids)
+
+    bodies = [{'id': entity_id, 'body': body} for entity_id, body in rows if body is not None]
+    if bodies:
+        connection.execute(text(f"INSERT INTO {table} ({key}, body) VALUES (:id, :body)"), bodies)
+
+# Only the app's sessions: scripts that open their own Session against other databases aren't indexed
+@event.listens_for(db.session, 'after_flush')
+def update_search_index(session, flush_context):
+    # Runs inside the flushing transaction, so the index commits or rolls back with the rows themselves
+    if not any(MODEL_ENTITIES.get(type(obj)) for obj in session.new | session.dirty | session.deleted):
+        return
+    if get_search_mode(session.connection()) is None:
+        return
+
+    changes = {}
+    for obj in session.new | session.dirty:
+        entity = MODEL_ENTITIES.get(type(obj))
+        if entity is None:
+            continue
+        columns = SEARCH_ENTITIES[entity][2]
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[column].history.has_changes() for column in columns):
+            changes.setdefault(entity, []).append((obj.id, search_text(obj, columns)))
+
+    for obj in session.deleted:
+        entity = MODEL_ENTITIES.get(type(obj))
+        if entity is not None:
+            changes.setdefault(entity, []).append((obj.id, None))
+
+    if changes:
+        connection = session.connection()
+        for entity, rows in changes.items():
+            index_rows(connection, entity, rows)
+
+def rebuild_search_index(connection, batch_size=1000):
+    counts = {}
+    for entity, (table, model, columns) in SEARCH_ENTITIES.items():
+        connection.execute(text(f"DELETE FROM {table}"))
+        counts[entity] = 0
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                select(model.id, *(getattr(model, column) for column in columns))
+                .where(model.id > last_id).order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            connection.execute(
+                text(f"INSERT INTO {table} ({index_key(connection)}, body) VALUES (:id, :body)"),
+                [{'id': row[0], 'body': ' '.join(str(value) for value in row[1:] if value)} for row in rows]
+            )
+            counts[entity] += len(rows)
+            last_id = rows[-1][0]
+    return counts
+
+def like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def search_hits(entity, term):
+    # Subquery of (entity_id, rank) for rows matching term, best match first when ordered by rank
+    table = SEARCH_ENTITIES[entity][0]
+    term = term.strip()
+    params = {'term': term, 'pattern': like_pattern(term)}
+    search_mode = get_search_mode()
+
+    if search_mode == 'postgresql':
+        sql = f"""
+            SELECT id AS entity_id,
+                   -(ts_rank(document, plainto_tsquery('simple', :term)) + similarity(body, :term)) AS rank
+            FROM {table}
+            WHERE document @@ plainto_tsquery('simple', :term) OR body ILIKE :pattern
+        """
+    elif search_mode == 'trigram' and len(term) >= 3:
+        # A quoted phrase is a substring match for the trigram tokenizer
+        params['match'] = '"' + term.replace('"', '""') + '"'
+        sql = f"SELECT rowid AS entity_id, bm25({table}) AS rank FROM {table} WHERE {table} MATCH :match"
+    elif search_mode == 'fts5' and term.split():
+        params['match'] = ' '.join('"' + word.replace('"', '""') + '"*' for word in term.split())
+        sql = f"SELECT rowid AS entity_id, bm25({table}) AS rank FROM {table} WHERE {table} MATCH :match"
+    else:
+        # Terms shorter than a trigram, or no FTS5 at all
+        sql = f"SELECT rowid AS entity_id, 0.0 AS rank FROM {table} WHERE body LIKE :pattern ESCAPE '\\'"
+
+    return text(sql).bindparams(**{name: value for name, value in params.items() if f':{name}' in sql})\
+                    .columns(entity_id=db.Integer, rank=db.Float).subquery(f'{entity}_search_hits')
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, and_, or_
+from app import db
+from app.models.user import User
+from app.models.project import Project
+from app.models.task import Task
+from app.models.invitation import ProjectMember
+from app.utils.cache import TTLCache
+
+stats_cache = TTLCache(ttl=30)
+
+ADMIN_STATS_KEY = ('admin',)
+
+def _count_where(condition):
+    return func.count(case((condition, 1)))
+
+def get_user_stats(user_id):
+    # Per-user task counters plus visible project count in a single aggregate query
+    key = ('user', user_id)
+    stats = stats_cache.get(key)
+    if stats is not None:
+        return stats
+    
+    now = datetime.utcnow()
+    member_project_ids = select(ProjectMember.project_id).where(ProjectMember.user_id == user_id)
+    total_projects = select(func.count(Project.id)).where(
+        or_(Project.created_by == user_id, Project.id.in_(member_project_ids))
+    ).scalar_subquery()
+    
+    row = db.session.execute(
+        select(
+            total_projects.label('total_projects'),
+            func.count(Task.id).label('total_tasks'),
+            _count_where(Task.status == 'completed').label('completed_tasks'),
+            _count_where(and_(Task.due_date < now, Task.status != 'completed')).label('overdue_tasks')
+        ).where(Task.assigned_to == user_id)
+    ).one()
+    
+    stats = dict(row._mapping)
+    stats_cache.set(key, stats)
+    return stats
+
+def get_admin_stats():
+    # Site-wide totals for the admin dashboards in a single query
+    stats = stats_cache.get(ADMIN_STATS_KEY)
+    if stats is not None:
+        return stats
+    
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    
+    def count(column, *conditions):
+        return select(func.count(column)).where(*conditions).scalar_subquery()
+    
+    row = db.session.execute(
+        select(
+            count(User.id).label('total_users'),
+            count(User.id, User.is_active == True).label('active_users'),
+            count(User.id, User.last_login >= thirty_days_ago).label('recent_logins'),
+            count(Project.id).label('total_projects'),
+            count(Project.id, Project.status == 'active').label('active_projects'),
+            count(Task.id).label('total_tasks'),
+            count(Task.id, Task.status == 'completed').label('completed_tasks')
+        )
+    ).one()
+    
+    stats = dict(row._mapping)
+    stats_cache.set(ADMIN_STATS_KEY, stats)
+    return stats
+
+def invalidate_stats(*user_ids):
+    for user_id in user_ids:
+        if user_id:
+            stats_cache.pop(('user', user_id))
+    stats_cache.pop(ADMIN_STATS_KEY)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.canvas import CanvasBlob
+from app.utils.cache import TTLCache
+
+# Bytes read from the request stream per write, so memory stays flat for any upload size
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+# Running sha256 per upload session as (bytes hashed, hasher). A session resumed on another
+# worker, or after a restart, has no entry and is re-hashed from disk on completion.
+upload_hashers = TTLCache(ttl=6 * 3600, maxsize=1000)
+
+def upload_tmp_folder():
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def session_paths(upload_id):
+    folder = upload_tmp_folder()
+    return os.path.join(folder, f'{upload_id}.json'), os.path.join(folder, f'{upload_id}.part')
+
+def create_upload_session(canvas_id, user_id, filename, size):
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = session_paths(upload_id)
+    session = {
+        'upload_id': upload_id,
+        'canvas_id': canvas_id,
+        'user_id': user_id,
+        'filename': filename,
+        'size': size,
+        'offset': 0,
+        'created_at': time.time()
+    }
+    open(part_path, 'wb').close()
+    save_upload_session(session)
+    upload_hashers.set(upload_id, (0, hashlib.sha256()))
+    return session
+
+def load_upload_session(upload_id):
+    # upload_id is a hex token; anything else can't name a session file
+    if not upload_id.isalnum():
+        return None
+    meta_path, _ = session_paths(upload_id)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def save_upload_session(session):
+    meta_path, _ = session_paths(session['upload_id'])
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(session, file)
+    os.replace(tmp_path, meta_path)
+
+def discard_upload_session(upload_id):
+    upload_hashers.pop(upload_id)
+    for path in session_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+def stream_to_file(stream, file, hasher=None, limit=None):
+    # Copies a request stream to an open file in fixed-size reads; returns the number of bytes written
+    written = 0
+    while True:
+        chunk = stream.read(STREAM_BUFFER_SIZE)
+        if not chunk:
+            return written
+        written += len(chunk)
+        if limit is not None and written > limit:
+            raise ValueError('Upload is larger than its declared size')
+        file.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+
+def append_upload_chunk(session, stream):
+    # Appends one chunk at the session offset and keeps the running hash in step with it
+    _, part_path = session_paths(session['upload_id'])
+    hashed = upload_hashers.get(session['upload_id'])
+    hasher = hashed[1] if hashed and hashed[0] == session['offset'] else None
+
+    try:
+        with open(part_path, 'r+b') as file:
+            file.seek(session['offset'])
+            file.truncate()
+            written = stream_to_file(stream, file, hasher, limit=session['size'] - session['offset'])
+    except Exception:
+        # The hasher may have consumed bytes that were never committed to the offset
+        upload_hashers.pop(session['upload_id'])
+        raise
+
+    session['offset'] += written
+    save_upload_session(session)
+    if hasher is not None:
+        upload_hashers.set(session['upload_id'], (session['offset'], hasher))
+    else:
+        upload_hashers.pop(session['upload_id'])
+    return written
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(STREAM_BUFFER_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def finish_upload_hash(session):
+    _, part_path = session_paths(session['upload_id'])
+    hashed = upload_hashers.get(session['upload_id'])
+    if hashed and hashed[0] == session['offset']:
+        return hashed[1].hexdigest()
+    return file_sha256(part_path)
+
+def store_blob(part_path, sha256, size, extension):
+    # Moves a finished upload into the content-addressed store, or drops it if the content is already there
+    blob = CanvasBlob.query.filter_by(sha256=sha256).first()
+    if blob:
+        os.remove(part_path)
+        return blob
+
+    storage_path = f'canvas/blobs/{sha256[:2]}/{sha256}.{extension}'
+    target_path = os.path.join(current_app.config['UPLOAD_FOLDER'], storage_path)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.replace(part_path, target_path)
+
+    blob = CanvasBlob(sha256=sha256, size=size, storage_path=storage_path)
+    try:
+        # Savepoint, so losing a race with an identical upload only undoes the blob row
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        blob = CanvasBlob.query.filter_by(sha256=sha256).one()
+    return blob
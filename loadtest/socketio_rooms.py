@@ -0,0 +1,194 @@
+"""
+Socket.IO Canvas Room Load Test
+Opens many concurrent canvas connections against a running server, moves cursors
+in every room and reports how many rooms the server sustains and at what latency.
+
+    pip install aiohttp msgpack "python-socketio[asyncio_client]"
+    python serve.py
+    python loadtest/socketio_rooms.py --rooms 200 --clients-per-room 5 --duration 60
+
+Clients log in as distinct users (<user-prefix><n>, registered on first run with --password): the
+n-th client of every room is user n, so each room's cursor batches carry one cursor per participant.
+Run with --protocol compact to receive cursor batches as MessagePack frames instead of JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+import aiohttp
+import msgpack
+import socketio
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+class RoomLoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.sent = 0
+        self.frames = 0
+        self.received_bytes = 0
+        self.latencies = []
+
+    async def submit_form(self, session, path, fields):
+        """Post an HTML form with its CSRF token and return the response status"""
+        async with session.get(f"{self.args.url}{path}") as response:
+            page = await response.text()
+        match = CSRF_PATTERN.search(page)
+        form = dict(fields, csrf_token=match.group(1) if match else '')
+        async with session.post(f"{self.args.url}{path}", data=form, allow_redirects=False) as response:
+            return response.status
+
+    async def login(self, index):
+        """Log in as load test user `index`, registering it first if needed, and return the cookie header"""
+        username = f"{self.args.user_prefix}{index}"
+        credentials = {'username': username, 'password': self.args.password}
+        async with aiohttp.ClientSession() as session:
+            if await self.submit_form(session, '/auth/login', credentials) != 302:
+                await self.submit_form(session, '/auth/register', dict(
+                    credentials,
+                    email=f"{username}@loadtest.local",
+                    first_name='Load',
+                    last_name=f"Test {index}",
+                    confirm_password=self.args.password
+                ))
+                if await self.submit_form(session, '/auth/login', credentials) != 302:
+                    raise RuntimeError(f"Could not log in or register {username}")
+            cookies = session.cookie_jar.filter_cookies(self.args.url)
+            return '; '.join(f"{name}={morsel.value}" for name, morsel in cookies.items())
+
+    async def login_users(self, count):
+        """Session cookies for `count` distinct users, a few logins at a time"""
+        limit = asyncio.Semaphore(10)
+
+        async def login_one(index):
+            async with limit:
+                return await self.login(index)
+
+        return await asyncio.gather(*(login_one(index) for index in range(count)))
+
+    async def run_client(self, canvas_id, cookie, stop_at):
+        """One canvas participant: join a room, move the cursor and time incoming batches"""
+        client = socketio.AsyncClient(reconnection=False)
+        finished = False
+
+        def record_cursors(cursors):
+            now = time.time()
+            self.frames += 1
+            for cursor in cursors:
+                if 'sent_at' in cursor:
+                    self.latencies.append(now - cursor['sent_at'])
+
+        @client.on('cursor_update')
+        def on_cursor_update(data):
+            self.received_bytes += len(json.dumps(data, separators=(',', ':')))
+            record_cursors(data.get('cursors', []))
+
+        @client.on('c')
+        def on_compact_cursor_update(data):
+            # Compact frame: 'k' holds the cursors; sent_at is not a coded field so it keeps its name
+            self.received_bytes += len(data)
+            record_cursors(msgpack.unpackb(data, raw=False).get('k', []))
+
+        @client.on('disconnect')
+        def on_disconnect():
+            if not finished:
+                self.dropped += 1
+
+        try:
+            await client.connect(self.args.url, headers={'Cookie': cookie}, transports=['websocket'])
+        except Exception:
+            self.failed += 1
+            return
+
+        self.connected += 1
+        try:
+            await client.emit('join_canvas', {'canvas_id': canvas_id, 'protocol': self.args.protocol})
+            interval = 1.0 / self.args.cursor_hz
+            while time.time() < stop_at and client.connected:
+                await client.emit('cursor_move', {
+                    'canvas_id': canvas_id,
+                    'x': random.randint(0, 2000),
+                    'y': random.randint(0, 2000),
+                    'sent_at': time.time()
+                })
+                self.sent += 1
+                await asyncio.sleep(interval)
+        finally:
+            finished = True
+            if client.connected:
+                await client.disconnect()
+
+    def percentile(self, values, fraction):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    async def run(self):
+        total = self.args.rooms * self.args.clients_per_room
+        user_count = self.args.users if self.args.users > 0 else self.args.clients_per_room
+        print(f"Logging in {user_count} users...")
+        cookies = await self.login_users(user_count)
+        print(f"Connecting {total} clients to {self.args.rooms} rooms...")
+
+        stop_at = time.time() + self.args.ramp_seconds + self.args.duration
+        tasks = []
+        for index in range(total):
+            canvas_id = self.args.first_canvas_id + index % self.args.rooms
+            # The n-th client of each room, so no two clients in a room share a user
+            cookie = cookies[(index // self.args.rooms) % user_count]
+            tasks.append(asyncio.create_task(self.run_client(canvas_id, cookie, stop_at)))
+            # Spread connection attempts over the ramp-up period
+            await asyncio.sleep(self.args.ramp_seconds / total)
+
+        started = time.time()
+        await asyncio.gather(*tasks)
+        elapsed = max(time.time() - started, 0.001)
+
+        print("\n=== Load Test Summary ===")
+        print(f"Rooms: {self.args.rooms}, clients per room: {self.args.clients_per_room}")
+        print(f"Connected: {self.connected}, failed: {self.failed}, dropped: {self.dropped}")
+        print(f"Cursor moves sent: {self.sent} ({self.sent / elapsed:.0f}/sec)")
+        print(f"cursor_update frames received: {self.frames} ({self.frames / elapsed:.0f}/sec)")
+        if self.frames:
+            print(f"Cursor payload bytes ({self.args.protocol}): {self.received_bytes / self.frames:.0f} per frame")
+        if self.latencies:
+            print(f"Cursor latency ms: p50 {statistics.median(self.latencies) * 1000:.1f}, "
+                  f"p95 {self.percentile(self.latencies, 0.95) * 1000:.1f}, "
+                  f"p99 {self.percentile(self.latencies, 0.99) * 1000:.1f}")
+
+        p95 = self.percentile(self.latencies, 0.95)
+        sustained = self.failed == 0 and self.dropped == 0 and bool(self.latencies) and p95 <= self.args.max_p95_ms / 1000
+        print(f"{'✓' if sustained else '✗'} {self.args.rooms} rooms "
+              f"{'sustained' if sustained else 'not sustained'} (p95 limit {self.args.max_p95_ms} ms)")
+        return sustained
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent canvas room load test')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--user-prefix', default='loadtest', help='Usernames are <prefix>0, <prefix>1, ...')
+    parser.add_argument('--users', type=int, default=0, help='Distinct users to log in (default: --clients-per-room)')
+    parser.add_argument('--password', default='loadtest123', help='Password of the load test users')
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--clients-per-room', type=int, default=4)
+    parser.add_argument('--first-canvas-id', type=int, default=1)
+    parser.add_argument('--cursor-hz', type=float, default=10, help='Cursor moves per client per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of steady load after ramp-up')
+    parser.add_argument('--ramp-seconds', type=float, default=10)
+    parser.add_argument('--max-p95-ms', type=float, default=250)
+    parser.add_argument('--protocol', choices=('json', 'compact'), default='json',
+                        help='Realtime encoding negotiated on join_canvas')
+    args = parser.parse_args()
+
+    sustained = asyncio.run(RoomLoadTest(args).run())
+    raise SystemExit(0 if sustained else 1)
+
+if __name__ == '__main__':
+    main()
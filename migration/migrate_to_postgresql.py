@@ -7,11 +7,68 @@ import sqlite3
 import psycopg2
 import psycopg2.extras
 import os
+import io
 import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import json
 from urllib.parse import urlparse
 
+# Columns SQLite stores as 0/1 that PostgreSQL declares BOOLEAN
+BOOLEAN_COLUMNS = {
+    'users': {'is_active'}
+}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+DEFAULT_STATE_DIR = os.path.join(os.path.dirname(__file__), '.migration_state')
+
+# Tables in an order that satisfies foreign key constraints
+MIGRATION_ORDER = [
+    'users',
+    'projects',
+    'tasks',
+    'canvas',
+    'canvas_operations',
+    'canvas_elements',
+    'canvas_chat_messages',
+    'canvas_blobs',
+    'canvas_files',
+    'project_invitations',
+    'project_members'
+]
+
+class MigrationCheckpoint:
+    """Per-table progress stored as small JSON files so an interrupted run can resume"""
+    
+    def __init__(self, state_dir=DEFAULT_STATE_DIR):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+    
+    def _path(self, table_name):
+        return os.path.join(self.state_dir, f"{table_name}.json")
+    
+    def load(self, table_name):
+        try:
+            with open(self._path(table_name), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'last_id': 0, 'rows': 0, 'done': False}
+    
+    def save(self, table_name, state):
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        temp_path = self._path(table_name) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp_path, self._path(table_name))
+    
+    def reset(self):
+        for filename in os.listdir(self.state_dir):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(self.state_dir, filename))
+
 class SQLiteToPostgreSQLMigrator:
     def __init__(self, sqlite_path, postgresql_url):
         self.sqlite_path = sqlite_path
@@ -51,6 +108,7 @@ class SQLiteToPostgreSQLMigrator:
             role VARCHAR(20) NOT NULL DEFAULT 'user',
             is_active BOOLEAN DEFAULT TRUE,
             profile_picture VARCHAR(200) DEFAULT 'default-avatar.png',
+            profile_picture_variants TEXT,
             bio TEXT,
             phone VARCHAR(20),
             department VARCHAR(100),
@@ -73,6 +131,8 @@ class SQLiteToPostgreSQLMigrator:
             deadline TIMESTAMP,
             budget DECIMAL(10,2),
             progress INTEGER DEFAULT 0,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
@@ -98,13 +158,59 @@ class SQLiteToPostgreSQLMigrator:
         -- Canvas table
         CREATE TABLE IF NOT EXISTS canvas (
             id SERIAL PRIMARY KEY,
-            project_id INTEGER NOT NULL REFERENCES projects(id),
+            project_id INTEGER REFERENCES projects(id),
+            channel_key VARCHAR(64) UNIQUE,
             title VARCHAR(200) NOT NULL DEFAULT 'Untitled Canvas',
             content TEXT,
             created_by INTEGER NOT NULL REFERENCES users(id),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_saved TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            last_saved TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            revision INTEGER NOT NULL DEFAULT 0,
+            snapshot_revision INTEGER NOT NULL DEFAULT 0,
+            max_element_width DOUBLE PRECISION,  -- NULL until measured; the app sets 0 on new canvases
+            max_element_height DOUBLE PRECISION
+        );
+
+        -- Canvas Operations table (per-revision patch log)
+        CREATE TABLE IF NOT EXISTS canvas_operations (
+            id SERIAL PRIMARY KEY,
+            canvas_id INTEGER NOT NULL REFERENCES canvas(id),
+            revision INTEGER NOT NULL,
+            operations TEXT,
+            created_by INTEGER NOT NULL REFERENCES users(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(canvas_id, revision)
+        );
+
+        -- Canvas Presence table (live socket connections; not migrated, rows are rebuilt as clients join)
+        CREATE TABLE IF NOT EXISTS canvas_presence (
+            sid VARCHAR(64) NOT NULL,
+            canvas_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name VARCHAR(200),
+            protocol VARCHAR(10) NOT NULL DEFAULT 'json',
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (sid, canvas_id)
+        );
+
+        -- Image generation jobs (ephemeral, polled through any worker)
+        CREATE TABLE IF NOT EXISTS image_generation_jobs (
+            job_id VARCHAR(32) PRIMARY KEY,
+            canvas_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            prompt TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            model VARCHAR(50) NOT NULL,
+            generated_by VARCHAR(200),
+            cached BOOLEAN NOT NULL DEFAULT FALSE,
+            image_url TEXT,
+            message TEXT,
+            generated_at TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
         );
 
         -- Canvas Elements table
@@ -118,6 +224,13 @@ class SQLiteToPostgreSQLMigrator:
             height DECIMAL(10,2) DEFAULT 100,
             content TEXT,
             style TEXT,
+            content_data BYTEA,
+            style_data BYTEA,
+            background_color VARCHAR(100),
+            color VARCHAR(100),
+            font_family VARCHAR(100),
+            font_size DOUBLE PRECISION,
+            opacity DOUBLE PRECISION,
             z_index INTEGER DEFAULT 1,
             created_by INTEGER NOT NULL REFERENCES users(id),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -132,6 +245,17 @@ class SQLiteToPostgreSQLMigrator:
             message TEXT NOT NULL,
             message_type VARCHAR(20) DEFAULT 'text',
             file_path VARCHAR(500),
+            client_ref VARCHAR(32),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        -- Canvas Blobs table (content-addressed file store)
+        CREATE TABLE IF NOT EXISTS canvas_blobs (
+            id SERIAL PRIMARY KEY,
+            sha256 VARCHAR(64) UNIQUE NOT NULL,
+            size BIGINT NOT NULL,
+            storage_path VARCHAR(500) NOT NULL,
+            derivatives TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
@@ -139,11 +263,12 @@ class SQLiteToPostgreSQLMigrator:
         CREATE TABLE IF NOT EXISTS canvas_files (
             id SERIAL PRIMARY KEY,
             canvas_id INTEGER NOT NULL REFERENCES canvas(id),
+            blob_id INTEGER REFERENCES canvas_blobs(id),
             filename VARCHAR(255) NOT NULL,
             original_filename VARCHAR(255) NOT NULL,
             file_path VARCHAR(500) NOT NULL,
             file_type VARCHAR(50) NOT NULL,
-            file_size INTEGER NOT NULL,
+            file_size BIGINT NOT NULL,
             uploaded_by INTEGER NOT NULL REFERENCES users(id),
             uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
@@ -178,6 +303,12 @@ class SQLiteToPostgreSQLMigrator:
         CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks(assigned_to);
         CREATE INDEX IF NOT EXISTS idx_canvas_project_id ON canvas(project_id);
         CREATE INDEX IF NOT EXISTS idx_canvas_elements_canvas_id ON canvas_elements(canvas_id);
+        CREATE INDEX IF NOT EXISTS idx_canvas_elements_canvas_id_position ON canvas_elements(canvas_id, position_x, position_y);
+        CREATE INDEX IF NOT EXISTS idx_canvas_chat_messages_canvas_id_id ON canvas_chat_messages(canvas_id, id);
+        CREATE INDEX IF NOT EXISTS idx_canvas_chat_messages_client_ref ON canvas_chat_messages(client_ref);
+        CREATE INDEX IF NOT EXISTS idx_canvas_presence_canvas_id_user_id ON canvas_presence(canvas_id, user_id);
+        CREATE INDEX IF NOT EXISTS idx_canvas_presence_last_seen ON canvas_presence(last_seen);
+        CREATE INDEX IF NOT EXISTS idx_image_generation_jobs_created_at ON image_generation_jobs(created_at);
         CREATE INDEX IF NOT EXISTS idx_project_members_project_id ON project_members(project_id);
         CREATE INDEX IF NOT EXISTS idx_project_members_user_id ON project_members(user_id);
         """
@@ -250,6 +381,172 @@ class SQLiteToPostgreSQLMigrator:
             self.pg_conn.rollback()
             raise
 
+    def iter_sqlite_chunks(self, table_name, chunk_size=DEFAULT_CHUNK_SIZE, after_id=0):
+        """Yield (columns, rows) from SQLite in primary key order, one chunk at a time"""
+        sqlite_cursor = self.sqlite_conn.cursor()
+        
+        while True:
+            sqlite_cursor.execute(
+                f"SELECT * FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, chunk_size)
+            )
+            rows = sqlite_cursor.fetchall()
+            if not rows:
+                return
+            
+            columns = [description[0] for description in sqlite_cursor.description]
+            yield columns, rows
+            after_id = rows[-1]['id']
+
+    def encode_copy_value(self, table_name, column, value):
+        """Encode a single value for COPY ... WITH (FORMAT csv); unquoted empty means NULL"""
+        if value is None:
+            return ''
+        if column in BOOLEAN_COLUMNS.get(table_name, ()):
+            return 't' if value else 'f'
+        if isinstance(value, bytes):
+            return '\\x' + value.hex()
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return '"' + str(value).replace('"', '""') + '"'
+
+    def copy_rows(self, pg_cursor, table_name, columns, rows):
+        """Write one chunk of rows through COPY FROM STDIN, keeping the original IDs"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(
+                self.encode_copy_value(table_name, column, value)
+                for column, value in zip(columns, row)
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        
+        pg_cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+    def reset_sequence(self, table_name):
+        """Move the id sequence past the highest migrated id"""
+        pg_cursor = self.pg_conn.cursor()
+        pg_cursor.execute(f"""
+            SELECT setval(
+                pg_get_serial_sequence('{table_name}', 'id'),
+                COALESCE((SELECT MAX(id) FROM {table_name}), 1),
+                (SELECT MAX(id) FROM {table_name}) IS NOT NULL
+            )
+        """)
+        self.pg_conn.commit()
+
+    def bulk_migrate_table(self, table_name, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Stream a table into PostgreSQL with COPY in fixed-size chunks, preserving IDs"""
+        started = time.time()
+        migrated = 0
+        
+        try:
+            pg_cursor = self.pg_conn.cursor()
+            for columns, rows in self.iter_sqlite_chunks(table_name, chunk_size):
+                self.copy_rows(pg_cursor, table_name, columns, rows)
+                self.pg_conn.commit()
+                migrated += len(rows)
+            
+            self.reset_sequence(table_name)
+        except Exception as e:
+            print(f"✗ Error migrating {table_name}: {e}")
+            self.pg_conn.rollback()
+            raise
+        
+        elapsed = time.time() - started
+        rate = migrated / elapsed if elapsed > 0 else migrated
+        print(f"✓ Migrated {migrated} rows from {table_name} in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+        return migrated
+
+    def resumable_migrate_table(self, table_name, checkpoint, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Bulk-migrate a table chunk by chunk, checkpointing after every committed chunk"""
+        state = checkpoint.load(table_name)
+        if state['done']:
+            print(f"  {table_name} already migrated ({state['rows']} rows), skipping")
+            return 0
+        
+        # Chunks commit in id order, so the highest id in PostgreSQL is the true resume point
+        pg_cursor = self.pg_conn.cursor()
+        pg_cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table_name}")
+        last_id = max(state['last_id'], pg_cursor.fetchone()[0])
+        if last_id:
+            print(f"  Resuming {table_name} after id {last_id}")
+        
+        started = time.time()
+        migrated = 0
+        
+        try:
+            for columns, rows in self.iter_sqlite_chunks(table_name, chunk_size, after_id=last_id):
+                self.copy_rows(pg_cursor, table_name, columns, rows)
+                self.pg_conn.commit()
+                
+                migrated += len(rows)
+                state.update(last_id=rows[-1]['id'], rows=state['rows'] + len(rows))
+                checkpoint.save(table_name, state)
+            
+            self.reset_sequence(table_name)
+        except Exception:
+            self.pg_conn.rollback()
+            raise
+        
+        state['done'] = True
+        checkpoint.save(table_name, state)
+        
+        elapsed = time.time() - started
+        rate = migrated / elapsed if elapsed > 0 else migrated
+        print(f"✓ Migrated {migrated} rows from {table_name} in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+        return migrated
+
+    def get_migration_levels(self, tables=MIGRATION_ORDER):
+        """Group tables into levels; every table only references tables in earlier levels"""
+        remaining = list(tables)
+        migrated = set()
+        levels = []
+        
+        while remaining:
+            level = [
+                table for table in remaining
+                if all(fk_table in migrated or fk_table == table or fk_table not in tables
+                       for fk_table in self.get_foreign_keys(table).values())
+            ]
+            if not level:
+                raise ValueError(f"Circular foreign keys between: {', '.join(remaining)}")
+            
+            levels.append(level)
+            migrated.update(level)
+            remaining = [table for table in remaining if table not in migrated]
+        
+        return levels
+
+    def migrate_all_data_parallel(self, workers=4, chunk_size=DEFAULT_CHUNK_SIZE, state_dir=DEFAULT_STATE_DIR):
+        """Migrate independent tables concurrently, level by level, resuming from checkpoints"""
+        levels = self.get_migration_levels()
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for level in levels:
+                print(f"Migrating {', '.join(level)}...")
+                futures = {
+                    executor.submit(migrate_table_worker, self.sqlite_path, self.postgresql_url,
+                                    table, chunk_size, state_dir): table
+                    for table in level
+                }
+                
+                failed = []
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"✗ Failed to migrate {futures[future]}: {e}")
+                        failed.append(futures[future])
+                
+                # Dependent tables cannot be loaded until this level is complete
+                if failed:
+                    raise RuntimeError(f"Migration stopped after failures in: {', '.join(failed)}. "
+                                       f"Rerun to resume from the last committed chunk.")
+
     def get_foreign_keys(self, table_name):
         """Get foreign key relationships for a table"""
         fk_mapping = {
@@ -257,33 +554,26 @@ class SQLiteToPostgreSQLMigrator:
             'tasks': {'project_id': 'projects', 'assigned_to': 'users', 'created_by': 'users'},
             'canvas': {'project_id': 'projects', 'created_by': 'users'},
             'canvas_elements': {'canvas_id': 'canvas', 'created_by': 'users'},
+            'canvas_operations': {'canvas_id': 'canvas', 'created_by': 'users'},
             'canvas_chat_messages': {'canvas_id': 'canvas', 'user_id': 'users'},
-            'canvas_files': {'canvas_id': 'canvas', 'uploaded_by': 'users'},
+            'canvas_files': {'canvas_id': 'canvas', 'blob_id': 'canvas_blobs', 'uploaded_by': 'users'},
             'project_invitations': {'project_id': 'projects', 'inviter_id': 'users', 'invitee_id': 'users'},
             'project_members': {'project_id': 'projects', 'user_id': 'users'}
         }
         return fk_mapping.get(table_name, {})
 
-    def migrate_all_data(self):
+    def migrate_all_data(self, bulk=False, chunk_size=DEFAULT_CHUNK_SIZE):
         """Migrate all data in the correct order to handle foreign key constraints"""
-        migration_order = [
-            'users',
-            'projects', 
-            'tasks',
-            'canvas',
-            'canvas_elements',
-            'canvas_chat_messages',
-            'canvas_files',
-            'project_invitations',
-            'project_members'
-        ]
-        
         id_mappings = {}
         
-        for table in migration_order:
+        for table in MIGRATION_ORDER:
             print(f"Migrating {table}...")
             try:
-                id_mappings[table] = self.migrate_table_data(table, id_mappings)
+                if bulk:
+                    # IDs are preserved, so no remapping is needed
+                    self.bulk_migrate_table(table, chunk_size)
+                else:
+                    id_mappings[table] = self.migrate_table_data(table, id_mappings)
             except Exception as e:
                 print(f"Failed to migrate {table}: {e}")
                 continue
@@ -295,8 +585,8 @@ class SQLiteToPostgreSQLMigrator:
         print("\n=== Migration Verification ===")
         
         tables = [
-            'users', 'projects', 'tasks', 'canvas', 
-            'canvas_elements', 'canvas_chat_messages', 
+            'users', 'projects', 'tasks', 'canvas', 'canvas_operations',
+            'canvas_elements', 'canvas_chat_messages', 'canvas_blobs',
             'canvas_files', 'project_invitations', 'project_members'
         ]
         
@@ -325,7 +615,7 @@ class SQLiteToPostgreSQLMigrator:
         if self.pg_conn:
             self.pg_conn.close()
 
-    def run_migration(self):
+    def run_migration(self, bulk=False, chunk_size=DEFAULT_CHUNK_SIZE, parallel=0, state_dir=DEFAULT_STATE_DIR):
         """Run the complete migration process"""
         print("=== SQLite to PostgreSQL Migration ===")
         print(f"Source: {self.sqlite_path}")
@@ -335,7 +625,10 @@ class SQLiteToPostgreSQLMigrator:
         try:
             self.connect_databases()
             self.create_postgresql_schema()
-            self.migrate_all_data()
+            if parallel:
+                self.migrate_all_data_parallel(workers=parallel, chunk_size=chunk_size, state_dir=state_dir)
+            else:
+                self.migrate_all_data(bulk=bulk, chunk_size=chunk_size)
             self.verify_migration()
             print("\n✓ Migration completed successfully!")
             
@@ -345,7 +638,29 @@ class SQLiteToPostgreSQLMigrator:
         finally:
             self.close_connections()
 
+def migrate_table_worker(sqlite_path, postgresql_url, table_name, chunk_size, state_dir):
+    """Process pool entry point: migrate one table over its own connections"""
+    migrator = SQLiteToPostgreSQLMigrator(sqlite_path, postgresql_url)
+    migrator.connect_databases()
+    try:
+        return migrator.resumable_migrate_table(table_name, MigrationCheckpoint(state_dir), chunk_size)
+    finally:
+        migrator.close_connections()
+
 def main():
+    parser = argparse.ArgumentParser(description='Migrate the SQLite database to PostgreSQL')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Stream tables with COPY in chunks, preserving original IDs')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows per chunk in bulk mode (default {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--parallel', type=int, default=0, metavar='N',
+                        help='Bulk-migrate independent tables on N processes with resumable checkpoints')
+    parser.add_argument('--state-dir', default=DEFAULT_STATE_DIR,
+                        help='Directory holding per-table checkpoints for --parallel')
+    parser.add_argument('--reset-state', action='store_true',
+                        help='Discard existing checkpoints before a --parallel run')
+    args = parser.parse_args()
+    
     # Configuration
     sqlite_path = os.path.join(os.path.dirname(__file__), '..', 'instance', 'project_management.db')
     
@@ -362,7 +677,11 @@ def main():
     
     # Run migration
     migrator = SQLiteToPostgreSQLMigrator(sqlite_path, postgresql_url)
-    migrator.run_migration()
+    if args.reset_state:
+        MigrationCheckpoint(args.state_dir).reset()
+    
+    migrator.run_migration(bulk=args.bulk, chunk_size=args.chunk_size,
+                           parallel=args.parallel, state_dir=args.state_dir)
 
 if __name__ == "__main__":
     main()
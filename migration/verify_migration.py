@@ -5,9 +5,45 @@ import sqlite3
 import psycopg2
 import psycopg2.extras
 import os
+import re
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from decimal import Decimal
 from urllib.parse import urlparse
 
+# Rows fetched and hashed per checksum range
+DEFAULT_RANGE_SIZE = 10000
+
+TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+def normalize_value(value):
+    """Map equivalent SQLite and PostgreSQL values onto one representation before hashing"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (Decimal, float)):
+        return format(float(value), '.6f')
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='microseconds')
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, str) and TIMESTAMP_PATTERN.match(value):
+        return datetime.fromisoformat(value).isoformat(sep=' ', timespec='microseconds')
+    return value
+
+def row_digest(row):
+    return hashlib.sha256(json.dumps([normalize_value(value) for value in row], default=str).encode('utf-8')).digest()
+
 class MigrationVerifier:
+    TABLES = [
+        'users', 'projects', 'tasks', 'canvas', 'canvas_operations',
+        'canvas_elements', 'canvas_chat_messages', 'canvas_blobs',
+        'canvas_files', 'project_invitations', 'project_members'
+    ]
+    
     def __init__(self, sqlite_path, postgresql_url):
         self.sqlite_path = sqlite_path
         self.postgresql_url = postgresql_url
@@ -30,15 +66,9 @@ class MigrationVerifier:
         """Verify record counts match between databases"""
         print("\n=== Table Record Count Verification ===")
         
-        tables = [
-            'users', 'projects', 'tasks', 'canvas', 
-            'canvas_elements', 'canvas_chat_messages', 
-            'canvas_files', 'project_invitations', 'project_members'
-        ]
-        
         all_match = True
         
-        for table in tables:
+        for table in self.TABLES:
             try:
                 # SQLite count
                 sqlite_cursor = self.sqlite_conn.cursor()
@@ -63,51 +93,6 @@ class MigrationVerifier:
         
         return all_match
 
-    def verify_data_integrity(self):
-        """Verify data integrity with sample checks"""
-        print("\n=== Data Integrity Verification ===")
-        
-        try:
-            # Check user data
-            sqlite_cursor = self.sqlite_conn.cursor()
-            sqlite_cursor.execute("SELECT username, email FROM users ORDER BY id LIMIT 5")
-            sqlite_users = sqlite_cursor.fetchall()
-            
-            pg_cursor = self.pg_conn.cursor()
-            pg_cursor.execute("SELECT username, email FROM users ORDER BY id LIMIT 5")
-            pg_users = pg_cursor.fetchall()
-            
-            users_match = len(sqlite_users) == len(pg_users)
-            if users_match:
-                for i, (sqlite_user, pg_user) in enumerate(zip(sqlite_users, pg_users)):
-                    if sqlite_user[0] != pg_user[0] or sqlite_user[1] != pg_user[1]:
-                        users_match = False
-                        break
-            
-            print(f"{'✓' if users_match else '✗'} User data integrity check")
-            
-            # Check project data
-            sqlite_cursor.execute("SELECT title, status FROM projects ORDER BY id LIMIT 5")
-            sqlite_projects = sqlite_cursor.fetchall()
-            
-            pg_cursor.execute("SELECT title, status FROM projects ORDER BY id LIMIT 5")
-            pg_projects = pg_cursor.fetchall()
-            
-            projects_match = len(sqlite_projects) == len(pg_projects)
-            if projects_match:
-                for sqlite_proj, pg_proj in zip(sqlite_projects, pg_projects):
-                    if sqlite_proj[0] != pg_proj[0] or sqlite_proj[1] != pg_proj[1]:
-                        projects_match = False
-                        break
-            
-            print(f"{'✓' if projects_match else '✗'} Project data integrity check")
-            
-            return users_match and projects_match
-            
-        except Exception as e:
-            print(f"✗ Data integrity check failed: {e}")
-            return False
-
     def verify_foreign_keys(self):
         """Verify foreign key relationships"""
         print("\n=== Foreign Key Relationship Verification ===")
@@ -140,7 +125,84 @@ class MigrationVerifier:
             print(f"✗ Foreign key verification failed: {e}")
             return False
 
-    def run_verification(self):
+    def get_common_columns(self, table):
+        """Columns present on both sides, in PostgreSQL column order"""
+        sqlite_cursor = self.sqlite_conn.cursor()
+        sqlite_cursor.execute(f"PRAGMA table_info({table})")
+        sqlite_columns = {row[1] for row in sqlite_cursor.fetchall()}
+        
+        pg_cursor = self.pg_conn.cursor()
+        pg_cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s ORDER BY ordinal_position
+        """, (table,))
+        return [row[0] for row in pg_cursor.fetchall() if row[0] in sqlite_columns]
+
+    def fetch_range_digests(self, table, columns, low, high):
+        """Per-row digests for ids in [low, high) from both databases, keyed by id"""
+        column_list = ', '.join(columns)
+        
+        sqlite_cursor = self.sqlite_conn.cursor()
+        sqlite_cursor.execute(
+            f"SELECT {column_list} FROM {table} WHERE id >= ? AND id < ? ORDER BY id", (low, high)
+        )
+        sqlite_rows = {row[0]: row_digest(row) for row in sqlite_cursor}
+        
+        pg_cursor = self.pg_conn.cursor()
+        pg_cursor.execute(
+            f"SELECT {column_list} FROM {table} WHERE id >= %s AND id < %s ORDER BY id", (low, high)
+        )
+        pg_rows = {row[0]: row_digest(row) for row in pg_cursor}
+        
+        return sqlite_rows, pg_rows
+
+    def compare_range(self, table, columns, low, high, mismatched_ids):
+        """Compare one id range; the per-row digests already point at the rows that differ"""
+        sqlite_rows, pg_rows = self.fetch_range_digests(table, columns, low, high)
+        
+        for row_id in sorted(sqlite_rows.keys() | pg_rows.keys()):
+            if sqlite_rows.get(row_id) != pg_rows.get(row_id):
+                mismatched_ids.append(row_id)
+
+    def verify_table_checksums(self, range_size=DEFAULT_RANGE_SIZE):
+        """Hash every row in primary key ranges on both sides and report the ids that differ"""
+        print("\n=== Row Checksum Verification ===")
+        
+        all_match = True
+        
+        for table in self.TABLES:
+            try:
+                columns = self.get_common_columns(table)
+                
+                sqlite_cursor = self.sqlite_conn.cursor()
+                sqlite_cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+                sqlite_min, sqlite_max = sqlite_cursor.fetchone()
+                
+                pg_cursor = self.pg_conn.cursor()
+                pg_cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+                pg_min, pg_max = pg_cursor.fetchone()
+                
+                bounds = [value for value in (sqlite_min, sqlite_max, pg_min, pg_max) if value is not None]
+                mismatched_ids = []
+                if bounds:
+                    for low in range(min(bounds), max(bounds) + 1, range_size):
+                        self.compare_range(table, columns, low, low + range_size, mismatched_ids)
+                
+                if mismatched_ids:
+                    all_match = False
+                    preview = ', '.join(str(row_id) for row_id in mismatched_ids[:10])
+                    more = f" (+{len(mismatched_ids) - 10} more)" if len(mismatched_ids) > 10 else ""
+                    print(f"✗ {table}: {len(mismatched_ids)} rows differ, ids {preview}{more}")
+                else:
+                    print(f"✓ {table}: all rows match")
+                    
+            except Exception as e:
+                print(f"✗ Error checksumming {table}: {e}")
+                all_match = False
+        
+        return all_match
+
+    def run_verification(self, range_size=DEFAULT_RANGE_SIZE):
         """Run complete verification"""
         print("=== Migration Verification Report ===")
         
@@ -148,7 +210,7 @@ class MigrationVerifier:
             self.connect_databases()
             
             counts_match = self.verify_table_counts()
-            data_integrity = self.verify_data_integrity()
+            data_integrity = self.verify_table_checksums(range_size)
             fk_integrity = self.verify_foreign_keys()
             
             print(f"\n=== Summary ===")
@@ -170,6 +232,11 @@ class MigrationVerifier:
                 self.pg_conn.close()
 
 def main():
+    parser = argparse.ArgumentParser(description='Verify a SQLite to PostgreSQL migration')
+    parser.add_argument('--range-size', type=int, default=DEFAULT_RANGE_SIZE,
+                        help=f'Rows per checksum range (default {DEFAULT_RANGE_SIZE})')
+    args = parser.parse_args()
+    
     sqlite_path = os.path.join(os.path.dirname(__file__), '..', 'instance', 'project_management.db')
     postgresql_url = os.environ.get('DATABASE_URL')
     
@@ -182,7 +249,7 @@ def main():
         return
     
     verifier = MigrationVerifier(sqlite_path, postgresql_url)
-    verifier.run_verification()
+    verifier.run_verification(range_size=args.range_size)
 
 if __name__ == "__main__":
     main()
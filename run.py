@@ -3,8 +3,10 @@ from app.models import User, Project, Task
 from sqlalchemy import select
 import os
 
-app = create_app()
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
+# Spawned image derivative workers import this module as __mp_main__ and don't need the app
+if __name__ != '__mp_main__':
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
 
 if __name__ == '__main__':
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
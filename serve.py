@@ -0,0 +1,32 @@
+# Production entry point: runs the Socket.IO server on green threads, so an idle
+# canvas connection costs a greenlet instead of an OS thread.
+#
+#   python serve.py
+#   gunicorn -k geventwebsocket.gunicorn.workers.GeventWebSocketWorker -w 1 -b 0.0.0.0:5000 serve:app
+#
+# For more than one worker, set SOCKETIO_MESSAGE_QUEUE and use sticky sessions in the load balancer.
+import os
+
+async_mode = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+# Image derivative workers are spawned processes that import this module as __mp_main__;
+# they only render images, so they neither patch nor build the app
+if __name__ != '__mp_main__':
+    # Patching has to happen before anything imports socket, threading or psycopg2
+    if async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    elif async_mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+        from psycogreen.eventlet import patch_psycopg
+        patch_psycopg()
+
+    from app import create_app, socketio
+
+    app = create_app()
+
+if __name__ == '__main__':
+    socketio.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,83 @@
+import time
+import pytest
+from app.utils.imagegen import FakeProvider, ImageGenerationService, QueueFullError
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, room=None):
+        self.emitted.append((event, data, room))
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    import os
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+    from app import create_app
+    return create_app()
+
+@pytest.fixture
+def service(app):
+    generator = ImageGenerationService()
+    generator.init_app(app, RecordingSocketIO())
+    generator.provider = FakeProvider()
+    with app.app_context():
+        yield generator
+
+def wait_for(service, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = service.get_job(job_id)
+        if job['status'] != 'pending':
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} still pending')
+
+def test_identical_prompts_in_flight_share_one_provider_call(service):
+    service.provider = FakeProvider(delay=0.2)
+    first = service.submit(1, 1, 'Admin User', 'a lighthouse', 512, 512, 'flux')
+    second = service.submit(1, 1, 'Admin User', 'a lighthouse', 512, 512, 'flux')
+
+    first, second = wait_for(service, first['job_id']), wait_for(service, second['job_id'])
+    assert service.provider.calls == 1
+    assert first['status'] == second['status'] == 'completed'
+    assert first['image_url'] == second['image_url']
+    assert [event for event, _, _ in service.socketio.emitted] == ['image_generated', 'image_generated']
+
+def test_cached_prompt_completes_without_provider_call(service):
+    job = wait_for(service, service.submit(1, 1, 'Admin User', 'a harbour', 256, 256, 'flux')['job_id'])
+
+    again = service.submit(1, 1, 'Admin User', 'a harbour', 256, 256, 'flux')
+    assert again['status'] == 'completed'
+    assert again['cached'] is True
+    assert again['image_url'] == job['image_url']
+    assert service.provider.calls == 1
+
+def test_distinct_prompts_in_flight_are_bounded(service):
+    service.provider = FakeProvider(delay=0.2)
+    service.max_pending = 1
+    running = service.submit(1, 1, 'Admin User', 'first prompt', 512, 512, 'flux')
+
+    with pytest.raises(QueueFullError):
+        service.submit(1, 1, 'Admin User', 'second prompt', 512, 512, 'flux')
+    # Joining the prompt already in flight doesn't take another slot
+    joined = service.submit(1, 1, 'Admin User', 'first prompt', 512, 512, 'flux')
+
+    assert wait_for(service, running['job_id'])['status'] == 'completed'
+    assert wait_for(service, joined['job_id'])['status'] == 'completed'
+    assert service.provider.calls == 1
+
+def test_provider_failure_marks_job_failed(service):
+    service.provider = FakeProvider(fail=True)
+    job = wait_for(service, service.submit(1, 1, 'Admin User', 'a storm', 512, 512, 'flux')['job_id'])
+
+    assert job['status'] == 'failed'
+    assert job['message'] == 'Fake provider failure'
+    assert service.socketio.emitted[-1][0] == 'image_generation_failed'
+
+def test_job_can_be_polled_through_another_worker(app, service):
+    job = wait_for(service, service.submit(1, 1, 'Admin User', 'a bridge', 512, 512, 'flux')['job_id'])
+
+    other_worker = ImageGenerationService()
+    other_worker.init_app(app, RecordingSocketIO())
+    assert other_worker.get_job(job['job_id']) == job